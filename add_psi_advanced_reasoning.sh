@@ -176,6 +176,10 @@ AVAILABLE_TOOLS_AND_LLMS = {
     ]
 }
 
+# The tool and LLM list is fixed once the app starts, so the invariant head of the orchestrator prompt is
+# rendered here once instead of re-serializing AVAILABLE_TOOLS_AND_LLMS on every /api/chat request
+ORCHESTRATOR_PROMPT_PREFIX = f"{ORCHESTRATOR_SYSTEM_PROMPT}\n\nAVAILABLE_TOOLS_AND_LLMS:\n{json.dumps(AVAILABLE_TOOLS_AND_LLMS, indent=2)}\n\n"
+
 # Placeholder for the actual document_processing_tool function if it needs to be redefined or ensured.
 # For this script, we assume document_processing_tool, read_file_tool, write_file_tool, and call_ollama
 # are already defined correctly in app.py or imported.
@@ -195,13 +199,11 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
     if not user_message_text:
         return jsonify({"response": "Please provide a message.", "agent_action": "none"}), 200
 
-    # Save user message to DB (using existing db and Message model)
-    user_msg_db = Message(sender='user', text=user_message_text)
-    db.session.add(user_msg_db)
-    db.session.commit()
+    # Message rows for this turn are collected here and written with one INSERT at the end
+    pending_msgs = [dict(sender='user', text=user_message_text, agent_action=None)]
 
-    # Retrieve recent history for agent context
-    recent_messages_db = Message.query.order_by(Message.timestamp.desc()).limit(10).all()
+    # Retrieve recent history for agent context; only the two columns used below, not whole Message rows
+    recent_messages_db = db.session.query(Message.sender, Message.text).order_by(Message.timestamp.desc(), Message.id.desc()).limit(10).all()
     recent_messages_db.reverse() # Chronological order
 
     condensed_history_for_orchestrator = []
@@ -213,7 +215,7 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
 
     history_for_target_llm = condensed_history_for_orchestrator # Can be made more sophisticated later
 
-    orchestrator_prompt_string = f"{ORCHESTRATOR_SYSTEM_PROMPT}\n\nAVAILABLE_TOOLS_AND_LLMS:\n{json.dumps(AVAILABLE_TOOLS_AND_LLMS, indent=2)}\n\nCHAT_HISTORY (condensed):\n{json.dumps(condensed_history_for_orchestrator[-5:])}\n\nUSER_MESSAGE:\n{user_message_text}\n\nBased on the user message, available tools, LLMs, and chat history, what is the next action? Respond in JSON format as specified in the system prompt."
+    orchestrator_prompt_string = f"{ORCHESTRATOR_PROMPT_PREFIX}CHAT_HISTORY (condensed):\n{json.dumps(condensed_history_for_orchestrator[-5:])}\n\nUSER_MESSAGE:\n{user_message_text}\n\nBased on the user message, available tools, LLMs, and chat history, what is the next action? Respond in JSON format as specified in the system prompt."
 
     ai_response_text = "An error occurred during processing."
     agent_action = "orchestration_failed"
@@ -235,8 +237,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
         except json.JSONDecodeError as e:
             app.logger.error(f"Failed to parse orchestrator JSON response: {e}. Raw: {orchestrator_response_raw}")
             system_info_msg_text = f"System Error: Orchestrator response parsing failed. Using fallback. Raw response fragment: {orchestrator_response_raw[:200]}..."
-            system_info_msg = Message(sender='system-info', text=system_info_msg_text, agent_action='orchestrator_parse_error')
-            db.session.add(system_info_msg)
+            system_info_msg = dict(sender='system-info', text=system_info_msg_text, agent_action='orchestrator_parse_error')
+            pending_msgs.append(system_info_msg)
             # Fallback to general LLM
             ai_response_text = call_ollama("mistral", user_message_text, history_for_target_llm)
             agent_action = "llm_mistral_fallback_orchestrator_error"
@@ -246,8 +248,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
             tool_name = details.get("tool_name")
             system_info_log_text = f"Orchestrator selected tool: {tool_name}."
             app.logger.info(system_info_log_text)
-            orch_decision_msg = Message(sender='system-info', text=system_info_log_text, agent_action=f'orchestrator_selected_tool_{tool_name}')
-            db.session.add(orch_decision_msg)
+            orch_decision_msg = dict(sender='system-info', text=system_info_log_text, agent_action=f'orchestrator_selected_tool_{tool_name}')
+            pending_msgs.append(orch_decision_msg)
 
             tool_output_text_for_user = ""
 
@@ -297,8 +299,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
                     if read_op["success"]:
                         text_to_process = read_op["content"]
                         doc_source_msg_text = f"Agent will analyze {source_description} for query: {analysis_query}"
-                        doc_source_msg = Message(sender='system-info', text=doc_source_msg_text, agent_action='tool_doc_analysis_read_file')
-                        db.session.add(doc_source_msg)
+                        doc_source_msg = dict(sender='system-info', text=doc_source_msg_text, agent_action='tool_doc_analysis_read_file')
+                        pending_msgs.append(doc_source_msg)
                     else:
                         tool_output_text_for_user = f"Agent could not read {source_description} for document analysis. Error: {read_op['error']}"
                         agent_action = "tool_doc_analysis_read_fail"
@@ -306,8 +308,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
                     source_description = "directly provided text"
                     text_to_process = doc_content_from_orchestrator
                     doc_source_msg_text = f"Agent will analyze {source_description} for query: {analysis_query}"
-                    doc_source_msg = Message(sender='system-info', text=doc_source_msg_text, agent_action='tool_doc_analysis_direct_content')
-                    db.session.add(doc_source_msg)
+                    doc_source_msg = dict(sender='system-info', text=doc_source_msg_text, agent_action='tool_doc_analysis_direct_content')
+                    pending_msgs.append(doc_source_msg)
                 else:
                     tool_output_text_for_user = "Orchestrator chose 'document_analysis' but no filename or content was provided."
                     agent_action = "tool_doc_analysis_missing_source"
@@ -333,8 +335,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
             sub_prompt = details.get("sub_prompt")
             system_info_log_text = f"Orchestrator selected LLM: {llm_model} with sub-prompt (first 100 chars): '{sub_prompt[:100]}...'"
             app.logger.info(system_info_log_text)
-            orch_decision_msg = Message(sender='system-info', text=system_info_log_text, agent_action=f'orchestrator_selected_llm_{llm_model}')
-            db.session.add(orch_decision_msg)
+            orch_decision_msg = dict(sender='system-info', text=system_info_log_text, agent_action=f'orchestrator_selected_llm_{llm_model}')
+            pending_msgs.append(orch_decision_msg)
 
             if llm_model and sub_prompt:
                 ai_response_text = call_ollama(llm_model, sub_prompt, history_for_target_llm)
@@ -355,8 +357,8 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
             if action_type is None and agent_action == "orchestration_failed": # Initial state before parsing attempt
                  fallback_text = "System Error: Orchestrator did not provide a valid action. Using fallback."
 
-            system_info_msg = Message(sender='system-info', text=fallback_text, agent_action='orchestrator_unrecognized_action')
-            db.session.add(system_info_msg)
+            system_info_msg = dict(sender='system-info', text=fallback_text, agent_action='orchestrator_unrecognized_action')
+            pending_msgs.append(system_info_msg)
             ai_response_text = call_ollama("mistral", user_message_text, history_for_target_llm)
             agent_action = "llm_mistral_fallback_orchestrator_unknown_action"
             if "ERROR:" in ai_response_text:
@@ -366,22 +368,28 @@ def chat_with_psi_agent(): # Renamed function to avoid clash if old one is still
         app.logger.error(f"Ollama request failed: {e}")
         ai_response_text = f"ERROR: Failed to connect to AI service. Is Ollama running? Details: {e}"
         agent_action = "ollama_connection_error"
-        system_error_msg = Message(sender='system-info', text=ai_response_text, agent_action=agent_action)
-        db.session.add(system_error_msg)
+        system_error_msg = dict(sender='system-info', text=ai_response_text, agent_action=agent_action)
+        pending_msgs.append(system_error_msg)
     except Exception as e:
         app.logger.error(f"Unexpected error in chat processing: {e}", exc_info=True)
         ai_response_text = f"An unexpected server error occurred: {str(e)}"
         agent_action = "chat_processing_exception"
-        system_error_msg = Message(sender='system-info', text=ai_response_text, agent_action=agent_action)
-        db.session.add(system_error_msg)
+        system_error_msg = dict(sender='system-info', text=ai_response_text, agent_action=agent_action)
+        pending_msgs.append(system_error_msg)
 
     # Save final AI response to DB
-    ai_msg_db = Message(sender='ai', text=ai_response_text, agent_action=agent_action)
+    ai_msg_db = dict(sender='ai', text=ai_response_text, agent_action=agent_action)
     # tool_details_for_response is not directly saved to Message model here, but returned to frontend
-    # System messages related to tool use are saved above.
+    # System messages related to tool use were collected in pending_msgs above.
 
-    db.session.add(ai_msg_db)
-    db.session.commit()
+    pending_msgs.append(ai_msg_db)
+    try:
+        # Core executemany: plain rows, no ORM objects or identity-map bookkeeping
+        db.session.execute(Message.__table__.insert(), pending_msgs)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Failed to save chat messages: {e}", exc_info=True)
 
     # Ensure 'response' key matches what frontend expects (was responseData.response)
     return jsonify({"response": ai_response_text, "ai_response_text": ai_response_text, "agent_action": agent_action, "tool_details": tool_details_for_response}), 200
@@ -7,29 +7,27 @@ cd ~/psi_pwa_linux_new || { echo "Failed to navigate to project root. Exiting.";
 echo ">>> Creating agent_workspace directory..."
 mkdir -p agent_workspace
 
-echo ">>> Overwriting backend/app.py..."
-cat <<'EOF_APP_PY' > backend/app.py
-import os
-import re # Import re for potential future use, even if not immediately used
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import requests
-import json # For handling potential json.JSONDecodeError
+echo ">>> Writing backend/models.py..."
+cat <<'EOF_MODELS_PY' > backend/models.py
+import time
+from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
 
-app = Flask(__name__)
-agent_workspace_path = os.path.abspath("agent_workspace")
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///messages.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+db = SQLAlchemy() # Bound to the app in app.py with db.init_app(app)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def utc_from_micros(micros: int) -> datetime:
+    # Exact (no float rounding); orjson encodes the aware datetime as ISO 8601 with +00:00
+    return _EPOCH + timedelta(microseconds=micros)
 
 # Define the Message model
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender = db.Column(db.String(50), nullable=False)  # 'user' or 'ai'
     text = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # UTC epoch microseconds: integer compares and a compact index; both history queries order by it
+    timestamp = db.Column(db.BigInteger, default=lambda: time.time_ns() // 1000, index=True, nullable=False)
     agent_action = db.Column(db.String(100), nullable=True)  # Optional field for AI actions
 
     def to_dict(self):
@@ -37,43 +35,222 @@ class Message(db.Model):
             'id': self.id,
             'sender': self.sender,
             'text': self.text,
-            'timestamp': self.timestamp.isoformat(),
+            'timestamp': utc_from_micros(self.timestamp),
             'agent_action': self.agent_action
         }
+EOF_MODELS_PY
+
+echo ">>> Overwriting backend/app.py..."
+cat <<'EOF_APP_PY' > backend/app.py
+import os
+import re
+import sys
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+import orjson
+from flask_cors import CORS
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import bindparam, event, func, insert, select, text
+from models import db, Message, utc_from_micros
+try:
+    from gevent import get_hub, monkey as gevent_monkey
+except ImportError: # Only the threaded development server is available
+    gevent_monkey = None
+
+# Naive datetimes are stored as UTC, so they are serialized with an explicit +00:00 offset
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serves jsonify/request.get_json through orjson; types orjson can't encode go through Flask's default hook."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Flask(__name__)
+app.json = OrjsonProvider(app)
+agent_workspace_path = os.path.realpath("agent_workspace")
+MAX_READ_BYTES = 10 * 1024 * 1024 # read_file_tool refuses larger files instead of loading them into memory
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///messages.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"query_cache_size": 1200} # Compiled-statement cache for the hot queries
+MAX_REQUEST_BYTES = 1 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES # Werkzeug refuses larger bodies before they are read
+db.init_app(app)
+
+# Per-connection SQLite settings: WAL lets /api/history readers run alongside the chat writer,
+# and synchronous=NORMAL makes each commit one fsync (at checkpoint) instead of two
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA busy_timeout=30000;" # Wait up to 30 s for a lock instead of failing with "database is locked"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-20000;" # ~20 MB page cache
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.executescript(SQLITE_PRAGMAS)
+    cursor.close()
+
+# Last 5 messages as (id, sender, text), so a chat turn doesn't re-query and hydrate them.
+# Other gunicorn workers write too, so the window is reloaded whenever the newest id in the DB moves.
+HISTORY_WINDOW = 5
+RECENT = deque(maxlen=HISTORY_WINDOW)
+RECENT_LOCK = threading.Lock()
+
+# Hot statements built once; reusing the same construct keeps every execution a compiled-cache hit
+# Messages saved by one request share a timestamp, so the id breaks ties (still served by the timestamp index)
+_RECENT_STMT = select(Message.id, Message.sender, Message.text).order_by(Message.timestamp.desc(), Message.id.desc()).limit(HISTORY_WINDOW)
+_LATEST_ID_STMT = select(func.max(Message.id))
+_HISTORY_STMT = (
+    select(Message.id, Message.sender, Message.text, Message.timestamp, Message.agent_action)
+    .order_by(Message.timestamp.asc(), Message.id.asc())
+    .execution_options(yield_per=1000)
+)
+# One page of history older than message id :before, newest first; served from the primary key
+# (keyset pagination), so deep pages cost the same as the first one, unlike OFFSET
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 500
+_HISTORY_PAGE_STMT = (
+    select(Message.id, Message.sender, Message.text, Message.timestamp, Message.agent_action)
+    .where(Message.id < bindparam("before"))
+    .order_by(Message.id.desc())
+    .limit(bindparam("limit"))
+)
+# Full /api/history body, reused while max(id) is unchanged. Messages are only ever appended,
+# so a new max(id) is the only invalidation needed, and it is seen by every gunicorn worker.
+_history_cache = {"max_id": None, "body": None}
+_history_cache_lock = threading.Lock()
+
+def _reload_recent():
+    rows = db.session.execute(_RECENT_STMT).all()
+    RECENT.clear()
+    RECENT.extend((r.id, r.sender, r.text) for r in reversed(rows)) # Chronological order
+
+def recent_history() -> list:
+    """Last HISTORY_WINDOW messages as (sender, text) tuples, oldest first."""
+    latest_id = db.session.execute(_LATEST_ID_STMT).scalar() # PK lookup, no table scan
+    with RECENT_LOCK:
+        if (RECENT[-1][0] if RECENT else None) != latest_id:
+            _reload_recent()
+        return [(sender, text) for _, sender, text in RECENT]
 
 # Function to initialize the database
 def init_db():
     with app.app_context():
+        url = db.engine.url
+        if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+            event.listen(db.engine, "connect", _set_sqlite_pragmas)
+            db.engine.dispose() # Connections opened before this point would miss the PRAGMAs
+            # SQLite keeps the old journal mode where WAL isn't supported (e.g. network filesystems)
+            journal_mode = db.session.execute(text("PRAGMA journal_mode")).scalar()
+            if journal_mode != "wal":
+                print(f"Warning: SQLite journal_mode is '{journal_mode}', not WAL; history reads will block on chat writes.")
         db.create_all()
+        # Databases created before timestamps were integers hold SQLAlchemy's DATETIME text
+        # ('YYYY-MM-DD HH:MM:SS.ffffff'); convert those rows to epoch microseconds in place
+        db.session.execute(text(
+            "UPDATE message SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER) * 1000000"
+            " + CAST(substr(timestamp, 21, 6) AS INTEGER) WHERE typeof(timestamp) = 'text'"
+        ))
+        # create_all() doesn't add indexes to a table that already exists
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_message_timestamp ON message (timestamp)"))
+        db.session.commit()
+        with RECENT_LOCK:
+            _reload_recent()
     print("Database initialized!")
 
 init_db() # Initialize the database
 
 CORS(app) # Enable CORS for all routes
 
+# One pooled keep-alive session for all Ollama calls instead of a new TCP connection per request.
+# Ollama serves plain-text HTTP/1.1 (HTTP/2 would need TLS+ALPN), so concurrent calls each take
+# their own pooled connection; pool_maxsize bounds how many stay open for reuse.
+SESSION = requests.Session()
+_OLLAMA_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=Retry(total=0))
+SESSION.mount("http://", _OLLAMA_ADAPTER)
+SESSION.mount("https://", _OLLAMA_ADAPTER) # Same pool if Ollama is put behind a TLS proxy
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Connection": "keep-alive",
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "psi-backend/1.0",
+})
+OLLAMA_TIMEOUT = 120 # seconds
+# How long Ollama keeps a model loaded after a call; its own default (5m) means a reload after short idle gaps
+OLLAMA_KEEP_ALIVE = os.environ.get("PSI_OLLAMA_KEEP_ALIVE", "30m")
+
+# Ollama calls run here, off the request thread, while no database transaction is open.
+# Under the gevent worker these threads are greenlets, so this only caps in-flight Ollama calls
+# per process; raise PSI_OLLAMA_CONCURRENCY together with Ollama's own OLLAMA_NUM_PARALLEL.
+OLLAMA_CONCURRENCY = int(os.environ.get("PSI_OLLAMA_CONCURRENCY", "8"))
+LLM_POOL = ThreadPoolExecutor(max_workers=OLLAMA_CONCURRENCY, thread_name_prefix="ollama")
+
+# Messages about code go to the code model: the words code/codes/coding/coder (which covers
+# "deepseek-coder", but not "decode" or "barcode"), a fenced block, a line starting a lowercase
+# Python def/class/import, or JS "function(". Searched case-insensitively in place, no lowered copy.
+_CODE_RE = re.compile(r'\bcod(?:e|es|ing|er)\b|```|(?-i:^\s*(?:def|class|import)\s)|\bfunction\s*\(', re.I | re.M)
+_SYSTEM_MSG = {"role": "system", "content": "You are PSI, a helpful AI agent."}
+_ROLE_FOR_SENDER = {'user': 'user', 'ai': 'assistant'} # system-info messages aren't sent to the model
+
+# Replies to identical (model, messages) payloads, for dev/demo traffic. Off unless PSI_LLM_CACHE=1,
+# since a cached reply is returned even where sampling would have produced a different one.
+LLM_CACHE_ENABLED = os.environ.get("PSI_LLM_CACHE") == "1"
+LLM_CACHE_MAX_ENTRIES = 256
+_LLM_CACHE = OrderedDict()
+_LLM_CACHE_LOCK = threading.Lock()
+
+def _llm_cache_key(model_name: str, messages_for_ollama: list) -> bytes:
+    payload = orjson.dumps({"model": model_name, "messages": messages_for_ollama}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
 # Helper function to call Ollama
-def call_ollama(model_name: str, prompt_text: str, conversation_history: list):
-    ollama_url = "http://localhost:11434/api/generate"
+def call_ollama(model_name: str, prompt_text: str, conversation_history: list, stream: bool = False):
+    """Returns the reply text, or with stream=True the open response whose iter_lines() yields Ollama's NDJSON chunks."""
+    ollama_url = "http://localhost:11434/api/chat"
 
-    messages_for_ollama = [{"role": "system", "content": "You are PSI, a helpful AI agent."}]
-    for msg in conversation_history:
-        if msg.sender == 'user':
-            messages_for_ollama.append({"role": "user", "content": msg.text})
-        elif msg.sender == 'ai':
-            messages_for_ollama.append({"role": "assistant", "content": msg.text})
-    messages_for_ollama.append({"role": "user", "content": prompt_text})
+    messages_for_ollama = [
+        _SYSTEM_MSG,
+        *({"role": _ROLE_FOR_SENDER[sender], "content": text} for sender, text in conversation_history if sender in _ROLE_FOR_SENDER),
+        {"role": "user", "content": prompt_text},
+    ]
 
     ollama_payload = {
         "model": model_name,
-        "prompt": prompt_text, # Retained for compatibility, but messages is primary
         "messages": messages_for_ollama,
-        "stream": False
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE
     }
+    cache_key = None
+    if LLM_CACHE_ENABLED and not stream:
+        cache_key = _llm_cache_key(model_name, messages_for_ollama)
+        with _LLM_CACHE_LOCK:
+            if cache_key in _LLM_CACHE:
+                _LLM_CACHE.move_to_end(cache_key)
+                return _LLM_CACHE[cache_key]
     try:
-        response = requests.post(ollama_url, json=ollama_payload, timeout=120)
+        response = SESSION.post(ollama_url, json=ollama_payload, timeout=OLLAMA_TIMEOUT, stream=stream)
         response.raise_for_status()
-        ollama_response = response.json()
-        return ollama_response.get('response', 'No response from AI.')
+        if stream:
+            return response
+        ollama_response = orjson.loads(response.content) # Raw bytes straight to orjson, no text decode step
+        response_text = ollama_response.get('message', {}).get('content', 'No response from AI.')
+        if cache_key is not None:
+            with _LLM_CACHE_LOCK:
+                _LLM_CACHE[cache_key] = response_text
+                if len(_LLM_CACHE) > LLM_CACHE_MAX_ENTRIES:
+                    _LLM_CACHE.popitem(last=False)
+        return response_text
     except requests.exceptions.Timeout:
         print(f"Error: Timeout while communicating with Ollama for model {model_name}.")
         # Reraise the exception to be handled by the route
@@ -84,178 +261,235 @@ def call_ollama(model_name: str, prompt_text: str, conversation_history: list):
     except requests.exceptions.RequestException as e:
         print(f"Error communicating with Ollama for model {model_name}: {e}")
         raise
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         print(f"Error decoding JSON from Ollama response for model {model_name}.")
         raise
     # Do not catch generic Exception here, let it propagate if it's not a request/JSON error
 
 
+def message_row(sender: str, text: str, agent_action) -> dict:
+    return {"sender": sender, "text": text, "agent_action": agent_action}
+
+# Writes all of a request's messages (message_row dicts) in one transaction (one fsync) instead of a commit per
+# message, as a single Core INSERT: the ORM is only used for reads, so no instances or unit-of-work flush here
+def save_messages(messages: list):
+    now = time.time_ns() // 1000 # One clock read per request, shared by all of its messages
+    try:
+        ids = db.session.scalars(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            [{**m, "timestamp": now} for m in messages],
+        ).all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    with RECENT_LOCK:
+        if RECENT and RECENT[-1][0] == ids[0] - 1:
+            RECENT.extend((msg_id, m["sender"], m["text"]) for msg_id, m in zip(ids, messages))
+        else: # Another worker wrote in between
+            _reload_recent()
+
+def stream_chat_reply(ollama_stream, pending_msgs: list, agent_action_label: str):
+    """
+    Forwards Ollama's NDJSON chunks to the client as they arrive, then saves the assembled reply
+    once and ends with a {"response", "agent_action"} line like the non-streamed endpoint returns.
+    """
+    parts = []
+    try:
+        for line in ollama_stream.iter_lines():
+            if not line:
+                continue
+            parts.append(orjson.loads(line).get('message', {}).get('content', ''))
+            yield line + b"\n"
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        print(f"Error while streaming from Ollama: {e}")
+        yield orjson.dumps({"error": f"Ollama stream interrupted: {e}"}) + b"\n"
+        return
+    finally:
+        ollama_stream.close()
+
+    response_text = "".join(parts)
+    pending_msgs.append(message_row('ai', response_text, agent_action_label))
+    save_messages(pending_msgs)
+    yield orjson.dumps({"response": response_text, "agent_action": agent_action_label}) + b"\n"
+
+# File tool functions
+# Recently read files keyed by (path, mtime_ns, size): an unchanged file is served without reopening it
+READ_CACHE_MAX_ENTRIES = 128
+_READ_CACHE = OrderedDict()
+_READ_CACHE_LOCK = threading.Lock()
+
+def _in_workspace(full_path: str) -> bool:
+    # Symlinks resolved once; commonpath also rejects sibling dirs that merely share the prefix ("agent_workspace2")
+    return os.path.commonpath([os.path.realpath(full_path), agent_workspace_path]) == agent_workspace_path
+
+def read_file_tool(file_path: str):
+    try:
+        full_path = os.path.join(agent_workspace_path, file_path)
+        # Security check
+        if not _in_workspace(full_path):
+            return "Error: Access denied."
+        st = os.stat(full_path)
+        if st.st_size > MAX_READ_BYTES:
+            return "Error: File too large."
+        cache_key = (full_path, st.st_mtime_ns, st.st_size)
+        with _READ_CACHE_LOCK:
+            if cache_key in _READ_CACHE:
+                _READ_CACHE.move_to_end(cache_key)
+                return _READ_CACHE[cache_key]
+        # One unbuffered read of the known size, decoded once
+        with open(full_path, 'rb', buffering=0) as f:
+            content = f.read(st.st_size).decode('utf-8', errors='replace')
+        with _READ_CACHE_LOCK:
+            _READ_CACHE[cache_key] = content
+            if len(_READ_CACHE) > READ_CACHE_MAX_ENTRIES:
+                _READ_CACHE.popitem(last=False)
+        return content
+    except FileNotFoundError:
+        return "Error: File not found."
+    except (IOError, OSError) as e:
+        print(f"Error reading file {full_path}: {e}")
+        return "Error: Could not read file due to system error."
+
+def write_file_tool(file_path: str, content: str):
+    try:
+        full_path = os.path.join(agent_workspace_path, file_path)
+        # Security check
+        if not _in_workspace(full_path):
+            return "Error: Access denied."
+        with open(full_path, 'w') as f:
+            f.write(content)
+        return "Success: File written."
+    except (IOError, OSError) as e:
+        print(f"Error writing to file {full_path}: {e}")
+        return "Error: Could not write to file due to system error."
+
+def run_file_io(fn, *args):
+    """
+    Runs a blocking file tool. Disk I/O isn't cooperative under gevent, so under the gevent worker
+    it goes to the hub's native thread pool and only this greenlet waits, not the whole process.
+    With the threaded dev server the call already has its own thread and runs inline.
+    """
+    if gevent_monkey is not None and gevent_monkey.is_module_patched("threading"):
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+# --- Chat commands ---
+# A handler's outcome: the user message's agent_action, an optional system-info message, and the HTTP response
+def _command_outcome(user_action: str, agent_action, system_text, body: dict, status: int) -> dict:
+    return {"user_action": user_action, "agent_action": agent_action, "system_text": system_text, "body": body, "status": status}
+
+def _file_op_outcome(user_action: str, agent_action: str, file_path, result: str, status: int) -> dict:
+    # Save system message for file operation outcome
+    system_text = f"Agent action: {agent_action}. File: '{file_path or 'N/A'}'. Result: {result}"
+    return _command_outcome(user_action, agent_action, system_text, {"response": result, "agent_action": agent_action}, status)
+
+def handle_read(file_path: str) -> dict:
+    file_path = file_path.strip()
+    result = run_file_io(read_file_tool, file_path)
+    if result.startswith("Error:"):
+        return _file_op_outcome('user_command_read_file', "file_read_error", file_path, result, 400)
+    return _file_op_outcome('user_command_read_file', "file_read_success", file_path, result, 200)
+
+def handle_write(file_path: str, content: str) -> dict:
+    file_path = file_path.strip()
+    result = run_file_io(write_file_tool, file_path, content)
+    if result.startswith("Error:"):
+        return _file_op_outcome('user_command_write_file', "file_write_error", file_path, result, 400)
+    return _file_op_outcome('user_command_write_file', "file_write_success", file_path, result, 200)
+
+def malformed_write(usage: str):
+    return lambda: _file_op_outcome('user_command_write_file', "file_write_error", None, f"Error: Malformed write command. Use '{usage}'.", 400)
+
+def handle_doc(document_text: str) -> dict:
+    document_text = document_text.strip()
+    if not document_text:
+        # The user message is still saved; this is an error for the operation itself
+        return _command_outcome('none', None, None, {"error": "Document text is empty after 'process document:' command."}, 400)
+    result = f"Document processed. First 50 chars: {document_text[:50]}..."
+    return _command_outcome('none', 'tool_used_document_processing', f"Agent used document processing tool. Result: {result}",
+                            {"response": result, "agent_action": "document_processed"}, 200)
+
+# Checked in order; the first pattern that matches handles the message. Commands are case-insensitive,
+# arguments keep their original case. Bare "write to"/"save this to" prefixes report usage errors.
+_COMMANDS = [
+    (re.compile(r'^read file (.+)$', re.I | re.S), handle_read),
+    (re.compile(r'^show me content of (.+)$', re.I | re.S), handle_read),
+    (re.compile(r'^write to (.+?) content (.*)$', re.I | re.S), handle_write),
+    (re.compile(r'^save this to (.+?): (.*)$', re.I | re.S), handle_write),
+    (re.compile(r'^write to ', re.I), malformed_write("write to <filename> content <content>")),
+    (re.compile(r'^save this to ', re.I), malformed_write("save this to <filename>: <content>")),
+    (re.compile(r'^process document:(.*)$', re.I | re.S), handle_doc),
+]
+
 @app.route('/')
 def hello_world():
     return 'Hello from PSI Backend!'
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    # Fetch last 5 messages for conversation history
-    conversation_history = Message.query.order_by(Message.timestamp.desc()).limit(5).all()
-    conversation_history.reverse() # Chronological order
-
-    data = request.get_json()
+    # Check the declared size before reading or parsing anything
+    if request.content_length and request.content_length > MAX_REQUEST_BYTES:
+        return jsonify({"error": "Payload too large"}), 413
+    data = request.get_json(silent=True, cache=False) or {}
     user_message = data.get('message', '').strip()
 
     if not user_message:
         return jsonify({"error": "Please provide a message."}), 400 # Not saved to DB
 
-    user_message_lower = user_message.lower()
-    user_agent_action = 'none' # Default agent action for user message
-
-    # File operation command parsing
-    # Initialize file_op_processed to False. If a file operation is handled, this will be set to True.
-    file_op_processed = False
-    agent_action = None # To store action type like 'file_read_success'
-    response_data = None # To store response for file ops
-    status_code = 200 # Default success code
-
-    # Attempt to save user message first
-    # The agent_action for the user message will be updated if it's a file op
-
-    # Read commands
-    if user_message_lower.startswith("read file ") or user_message_lower.startswith("show me content of "):
-        file_op_processed = True
-        user_agent_action = 'user_command_read_file'
-        try:
-            if user_message_lower.startswith("read file "):
-                file_path = user_message.split(" ", 2)[2]
-            else: # "show me content of "
-                file_path = user_message.split(" ", 4)[4]
-
-            result = read_file_tool(file_path)
-            if result.startswith("Error:"):
-                agent_action = "file_read_error"
-                status_code = 400 # Or another appropriate error code
-            else:
-                agent_action = "file_read_success"
-            response_data = result
-        except IndexError:
-            result = "Error: Malformed read command. Use 'read file <filename>' or 'show me content of <filename>'."
-            agent_action = "file_read_error"
-            response_data = result
-            status_code = 400
-        except Exception as e: # Catch any other unexpected errors during parsing/tool call
-            result = f"Error: An unexpected error occurred processing read command. {str(e)}"
-            agent_action = "file_read_error"
-            response_data = result
-            status_code = 500
-
-
-    # Write commands
-    elif user_message_lower.startswith("write to ") or user_message_lower.startswith("save this to "):
-        file_op_processed = True
-        user_agent_action = 'user_command_write_file'
-        file_path = None
-        content = None
-        try:
-            if user_message_lower.startswith("write to "): # "write to <filename> content <content>"
-                # Split out "write to " part
-                command_body = user_message.split(" ", 2)[2]
-                if " content " in command_body:
-                    filename_part, content_part = command_body.split(" content ", 1)
-                    file_path = filename_part.strip()
-                    content = content_part
-                else:
-                    result = "Error: Malformed write command. Use 'write to <filename> content <content>'."
-                    agent_action = "file_write_error"
-                    response_data = result
-                    status_code = 400
-
-            elif user_message_lower.startswith("save this to "): # "save this to <filename>: <content>"
-                # Split out "save this to " part
-                command_body = user_message.split(" ", 3)[3]
-                if ": " in command_body:
-                    filename_part, content_part = command_body.split(": ", 1)
-                    file_path = filename_part.strip()
-                    content = content_part
-                else:
-                    result = "Error: Malformed write command. Use 'save this to <filename>: <content>'."
-                    agent_action = "file_write_error"
-                    response_data = result
-                    status_code = 400
-
-            if file_path and content is not None: # Ensure parsing was successful before calling tool
-                result = write_file_tool(file_path, content)
-                if result.startswith("Error:"):
-                    agent_action = "file_write_error"
-                    status_code = 400 # Or another appropriate error code
-                else:
-                    agent_action = "file_write_success"
-                response_data = result
-            elif not response_data: # If response_data wasn't set by a parsing error message
-                result = "Error: Could not parse filename or content for write operation."
-                agent_action = "file_write_error"
-                response_data = result
-                status_code = 400
-
-        except IndexError:
-            result = "Error: Malformed write command structure."
-            agent_action = "file_write_error"
-            response_data = result
-            status_code = 400
-        except Exception as e: # Catch any other unexpected errors
-            result = f"Error: An unexpected error occurred processing write command. {str(e)}"
-            agent_action = "file_write_error"
-            response_data = result
-            status_code = 500
-
-    # Save user message to DB (action updated if it was a file op)
-    user_msg_db = Message(sender='user', text=user_message, agent_action=user_agent_action)
-    db.session.add(user_msg_db)
-    db.session.commit()
-
-    if file_op_processed:
-        # Save system message for file operation outcome
-        system_msg_text = f"Agent action: {agent_action}. File: '{file_path if 'file_path' in locals() and file_path else 'N/A'}'. Result: {response_data}"
-        if agent_action and response_data: # Ensure these are set
-             system_msg_db = Message(sender='system-info', text=system_msg_text, agent_action=agent_action)
-             db.session.add(system_msg_db)
-             db.session.commit()
-        return jsonify({"response": response_data, "agent_action": agent_action}), status_code
-
-    # If not a file op, proceed with existing logic (document processing, LLM calls)
-    # Simple intent detection (existing logic)
-    if user_message.lower().startswith("process document:"):
-        document_text = user_message.split(":", 1)[1].strip()
-        if not document_text:
-            # User message already saved, this is an error for the operation itself
-            return jsonify({"error": "Document text is empty after 'process document:' command."}), 400
-
-        tool_output = {"result": f"Document processed. First 50 chars: {document_text[:50]}..."}
-        system_msg_db = Message(sender='system-info', text=f"Agent used document processing tool. Result: {tool_output['result']}", agent_action='tool_used_document_processing')
-        db.session.add(system_msg_db)
-        db.session.commit()
-        return jsonify({"response": tool_output['result'], "agent_action": "document_processed"}), 200
-
-    elif "code" in user_message.lower() or "deepseek-coder" in user_message.lower():
+    # Chat commands (file operations, document processing): one regex match per pattern, then dispatch
+    for pattern, handler in _COMMANDS:
+        match = pattern.match(user_message)
+        if match:
+            try:
+                outcome = handler(*match.groups())
+            except Exception as e: # Catch any other unexpected errors during the tool call
+                error = f"Error: An unexpected error occurred processing command. {str(e)}"
+                outcome = _command_outcome('none', 'command_error', None, {"response": error, "agent_action": "command_error"}, 500)
+            # User message and the outcome of the command are saved together
+            pending_msgs = [message_row('user', user_message, outcome["user_action"])]
+            if outcome["system_text"]:
+                pending_msgs.append(message_row('system-info', outcome["system_text"], outcome["agent_action"]))
+            save_messages(pending_msgs)
+            return jsonify(outcome["body"]), outcome["status"]
+
+    # Not a command: proceed with the LLM call; the user message is saved together with the reply
+    pending_msgs = [message_row('user', user_message, 'none')]
+
+    if _CODE_RE.search(user_message):
         model_to_use = "deepseek-coder"
         agent_action_label = "llm_deepseek"
     else:
         model_to_use = "mistral"
         agent_action_label = "llm_mistral"
 
+    # Last 5 messages for conversation history (chronological order); only LLM calls need it
+    conversation_history = recent_history()
+
+    # End the history read transaction before the long Ollama wait: an open read snapshot keeps
+    # WAL checkpoints from completing. The reply is written afterwards in a new, short transaction.
+    db.session.close()
+
     try:
-        response_text = call_ollama(model_to_use, user_message, conversation_history)
+        if data.get('stream'): # Opt-in: first tokens reach the client without waiting for the whole reply
+            ollama_stream = call_ollama(model_to_use, user_message, conversation_history, stream=True)
+            return Response(stream_with_context(stream_chat_reply(ollama_stream, pending_msgs, agent_action_label)), mimetype='application/x-ndjson')
 
-        ai_msg_db = Message(sender='ai', text=response_text, agent_action=agent_action_label)
-        db.session.add(ai_msg_db)
-        db.session.commit()
+        future = LLM_POOL.submit(call_ollama, model_to_use, user_message, conversation_history)
+        response_text = future.result(timeout=OLLAMA_TIMEOUT)
+
+        # Only persisted once Ollama has answered, so a failed call leaves no half-saved exchange
+        pending_msgs.append(message_row('ai', response_text, agent_action_label))
+        save_messages(pending_msgs)
 
         return jsonify({"response": response_text, "agent_action": agent_action_label}), 200
-    except requests.exceptions.Timeout:
+    except (requests.exceptions.Timeout, FuturesTimeoutError):
         return jsonify({"error": f"Failed to connect to Ollama ({model_to_use}): Timeout"}), 500
     except requests.exceptions.ConnectionError:
         return jsonify({"error": f"Failed to connect to Ollama ({model_to_use}): Connection Error"}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Failed to communicate with Ollama ({model_to_use}): {e}"}), 500
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return jsonify({"error": f"Invalid JSON response from Ollama ({model_to_use})"}), 500
     except Exception as e:
         print(f"An unexpected error occurred in chat endpoint: {e}")
@@ -263,43 +497,52 @@ def chat():
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    messages_db = Message.query.order_by(Message.timestamp.asc()).all()
-    messages_list = [msg.to_dict() for msg in messages_db]
-    return jsonify(messages_list), 200
+    # Without ?before/?limit the whole history is returned, as the frontend expects.
+    # With them, one page older than message id `before` (default: the newest messages), oldest first.
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', type=int)
+    if before is None and limit is None:
+        latest_id = db.session.execute(_LATEST_ID_STMT).scalar() # PK lookup, no table scan
+        with _history_cache_lock:
+            if _history_cache["body"] is not None and _history_cache["max_id"] == latest_id:
+                return Response(_history_cache["body"], mimetype='application/json'), 200
+        # Plain column rows, fetched in batches: no ORM instances or identity-map bookkeeping per message.
+        # A message added after latest_id was read only makes the body newer than its key,
+        # so the next request sees a different max(id) and rebuilds it.
+        rows = db.session.execute(_HISTORY_STMT)
+    else:
+        latest_id = None
+        limit = min(max(limit or HISTORY_PAGE_DEFAULT, 1), HISTORY_PAGE_MAX)
+        page_params = {"before": before if before is not None else sys.maxsize, "limit": limit}
+        rows = reversed(db.session.execute(_HISTORY_PAGE_STMT, page_params).all())
+    # Rows unpacked as plain tuples: Row attribute lookups cost more than building the dict itself
+    messages_list = [
+        {'id': msg_id, 'sender': sender, 'text': text_, 'timestamp': utc_from_micros(timestamp), 'agent_action': agent_action}
+        for msg_id, sender, text_, timestamp, agent_action in rows
+    ]
+    # Encoded straight to bytes: the largest response this app sends
+    body = orjson.dumps(messages_list, option=ORJSON_OPTIONS)
+    if latest_id is not None:
+        with _history_cache_lock:
+            _history_cache["max_id"] = latest_id
+            _history_cache["body"] = body
+    return Response(body, mimetype='application/json'), 200
 
 if __name__ == '__main__':
+    # Local development only; the setup script serves the app with gunicorn + gevent (see wsgi.py)
     # Removed db.create_all() from here as it's called by init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000)
+EOF_APP_PY
 
-# File tool functions
-def read_file_tool(file_path: str):
-    try:
-        full_path = os.path.join(agent_workspace_path, file_path)
-        # Security check
-        if not os.path.abspath(full_path).startswith(agent_workspace_path):
-            return "Error: Access denied."
-        with open(full_path, 'r') as f:
-            content = f.read()
-        return content
-    except FileNotFoundError:
-        return "Error: File not found."
-    except (IOError, OSError) as e:
-        print(f"Error reading file {full_path}: {e}")
-        return "Error: Could not read file due to system error."
+echo ">>> Writing backend/wsgi.py..."
+cat <<'EOF_WSGI_PY' > backend/wsgi.py
+# Patch sockets/threads before anything else is imported, so a chat request waiting on Ollama
+# yields its greenlet instead of blocking the worker
+from gevent import monkey
+monkey.patch_all()
 
-def write_file_tool(file_path: str, content: str):
-    try:
-        full_path = os.path.join(agent_workspace_path, file_path)
-        # Security check
-        if not os.path.abspath(full_path).startswith(agent_workspace_path):
-            return "Error: Access denied."
-        with open(full_path, 'w') as f:
-            f.write(content)
-        return "Success: File written."
-    except (IOError, OSError) as e:
-        print(f"Error writing to file {full_path}: {e}")
-        return "Error: Could not write to file due to system error."
-EOF_APP_PY
+from app import app
+EOF_WSGI_PY
 
 echo ">>> Overwriting frontend/src/App.tsx..."
 cat <<'EOF_APP_TSX' > frontend/src/App.tsx
@@ -354,12 +597,52 @@ function App() {
     setLoading(true);
 
     try {
-      const response = await axios.post('http://localhost:5000/api/chat', {
-        message: currentInput, // Use captured input
+      // Chat replies are streamed as NDJSON so tokens show up while Ollama generates them;
+      // file and document commands still answer with a single JSON body.
+      const response = await fetch('http://localhost:5000/api/chat', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: currentInput, stream: true }), // Use captured input
       });
 
-      const agentAction = response.data.agent_action;
-      const responseText = response.data.response;
+      if (!response.ok) {
+        const errorBody = await response.json().catch(() => ({}));
+        // If backend provides a specific error message, prefer that.
+        throw new Error(errorBody.error || errorBody.response || 'Error: Could not get response from AI. Check backend (http://localhost:5000) and Ollama (http://localhost:11434).');
+      }
+
+      if (response.body && response.headers.get('Content-Type')?.startsWith('application/x-ndjson')) {
+        // Empty AI message, filled in as chunks arrive
+        setMessages((prevMessages) => [...prevMessages, { text: '', sender: 'ai' }]);
+        setLoading(false);
+        const setStreamedText = (text: string) =>
+          setMessages((prevMessages) => [...prevMessages.slice(0, -1), { ...prevMessages[prevMessages.length - 1], text }]);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        let streamedText = '';
+        for (;;) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split('\n');
+          buffered = lines.pop() ?? ''; // Keep a partial line for the next read
+          for (const line of lines) {
+            if (!line) continue;
+            const chunk = JSON.parse(line);
+            if (chunk.error) throw new Error(chunk.error);
+            // The last line carries the complete reply as saved by the backend
+            streamedText = chunk.response !== undefined ? chunk.response : streamedText + (chunk.message?.content ?? '');
+            setStreamedText(streamedText);
+          }
+        }
+        return;
+      }
+
+      const data = await response.json();
+      const agentAction = data.agent_action;
+      const responseText = data.response;
 
       const aiMessage: Message = {
         text: responseText,
@@ -374,12 +657,11 @@ function App() {
     } catch (error) {
       console.error('Error sending message to backend:', error);
       let errorMessageText = 'Error: Could not get response from AI. Check backend (http://localhost:5000) and Ollama (http://localhost:11434).';
-      if (axios.isAxiosError(error) && error.response) {
-        // If backend provides a specific error message, prefer that.
-        errorMessageText = error.response.data.error || errorMessageText;
-      } else if (axios.isAxiosError(error) && error.request) {
-        // Network error or backend not reachable
-         errorMessageText = 'Error: Cannot connect to backend. Please ensure it is running.';
+      if (error instanceof TypeError) {
+        // fetch rejects with a TypeError when the backend is not reachable
+        errorMessageText = 'Error: Cannot connect to backend. Please ensure it is running.';
+      } else if (error instanceof Error && error.message) {
+        errorMessageText = error.message;
       }
       const errorMessage: Message = {
         text: errorMessageText,
@@ -432,8 +714,11 @@ EOF_APP_TSX
 echo ">>> Activating Python virtual environment..."
 source backend/venv/bin/activate || { echo "Failed to activate Python venv. Check backend/venv. Exiting."; exit 1; }
 
-echo ">>> Starting Flask backend server..."
-nohup python backend/app.py > backend.log 2>&1 &
+echo ">>> Installing production server (gunicorn + gevent) and orjson..."
+pip install gunicorn gevent orjson || { echo "Failed to install gunicorn/gevent/orjson. Exiting."; exit 1; }
+
+echo ">>> Starting Flask backend server (gunicorn, gevent workers)..."
+(cd backend && nohup gunicorn -k gevent -w 5 --worker-connections 500 --timeout 150 -b 0.0.0.0:5000 wsgi:app > ../backend.log 2>&1 &)
 echo "Backend server logs will be in backend.log"
 
 echo ">>> Starting React frontend server..."
@@ -470,7 +755,7 @@ echo "  tail -f backend.log"
 echo "  tail -f frontend.log"
 echo ""
 echo "To stop the servers:"
-echo "  pkill -f 'python backend/app.py'"
+echo "  pkill -f 'gunicorn -k gevent'"
 echo "  pkill -f 'npm start'" # Simplified pkill for npm start
 echo "  echo 'Servers stopped.'"
 echo ""
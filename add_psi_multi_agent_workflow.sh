@@ -217,17 +217,19 @@ elif action_type == "multi_agent_plan":
             elif agent_role == "FileIO":
                 operation, filename = None, None
                 content_for_writing = str(previous_step_result_text) if previous_step_result_text else ""
-                fn_match = re.search(r"(?:file named\s*['\"]?(?P<fn1>[^'\"]+)['\"]?|filename\s+(?P<fn2>[^\s]+))", sub_prompt.lower())
+                sub_prompt_lower = sub_prompt.lower()
+                fn_match = re.search(r"(?:file named\s*['\"]?(?P<fn1>[^'\"]+)['\"]?|filename\s+(?P<fn2>[^\s]+))", sub_prompt_lower)
                 if fn_match: filename = fn_match.group('fn1') or fn_match.group('fn2')
                 if not filename:
-                    if "write to file" in sub_prompt.lower():
-                        try: filename = sub_prompt.lower().split("write to file")[-1].strip().split()[0].replace("'", "").replace('"',"")
-                        except: pass
-                    elif "read file" in sub_prompt.lower():
-                        try: filename = sub_prompt.lower().split("read file")[-1].strip().split()[0].replace("'", "").replace('"',"")
-                        except: pass
-                if "write" in sub_prompt.lower(): operation = "write"
-                elif "read" in sub_prompt.lower(): operation = "read"
+                    # First word after the last "write to file"/"read file"; rpartition never raises on a missing part
+                    for file_command in ("write to file", "read file"):
+                        _, found, rest = sub_prompt_lower.rpartition(file_command)
+                        if found:
+                            first_word = (rest.split(None, 1) or [""])[0]
+                            filename = first_word.replace("'", "").replace('"', "") or None
+                            break
+                if "write" in sub_prompt_lower: operation = "write"
+                elif "read" in sub_prompt_lower: operation = "read"
                 if not filename: current_step_output_text = f"Error: FileIO filename could not be reliably determined from prompt: '{sub_prompt}'."
                 elif operation == "write":
                     if not content_for_writing:
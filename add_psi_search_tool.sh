@@ -57,6 +57,8 @@ def init_db():
         db = get_db()
         with app.open_resource('schema.sql', mode='r') as f:
             db.cursor().executescript(f.read())
+        # /api/history filters by user and orders by time; without this index every read sorts the whole table
+        db.execute('CREATE INDEX IF NOT EXISTS ix_messages_user_timestamp ON messages (user_id, timestamp)')
         db.commit()
 
 def log_message(user_id, role, content, agent_action=None, tool_details=None):
@@ -189,9 +191,16 @@ def chat():
 @app.route('/api/history', methods=['GET'])
 def history():
     user_id = request.args.get('user_id', 'default_user')
+    limit = request.args.get('limit', type=int) # Only the newest `limit` messages; the whole history without it
     db = get_db()
-    cur = db.execute('SELECT role, content, agent_action, tool_details, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp ASC', (user_id,))
-    messages = cur.fetchall()
+    # Messages logged in the same second share a timestamp, so rowid (insertion order) breaks ties
+    if limit is None:
+        cur = db.execute('SELECT role, content, agent_action, tool_details, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp ASC, rowid ASC', (user_id,))
+        messages = cur.fetchall()
+    else:
+        # Walk the index backwards from the newest message and stop after `limit` rows, then restore chronological order
+        cur = db.execute('SELECT role, content, agent_action, tool_details, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp DESC, rowid DESC LIMIT ?', (user_id, max(limit, 0)))
+        messages = cur.fetchall()[::-1]
     return jsonify([dict(msg) for msg in messages])
 
 # Serve React App
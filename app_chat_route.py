@@ -1,6 +1,38 @@
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
 import json
-from flask import Blueprint, request, jsonify
-import datetime # Assuming Message model uses datetime
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
+from typing import Any, Literal, Optional
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import datetime
+import httpx
+import msgspec
+import numpy as np
+import ollama
+import orjson
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit, prange
+except ImportError: # Numba is optional; the NumPy similarity kernel is used without it
+    njit = None
+
+try:
+    import uvloop
+except ImportError: # uvloop is optional; the Ollama loop falls back to the default asyncio loop
+    uvloop = None
 
 
 # --- Placeholder/Assumed External Functions and Variables ---
@@ -10,11 +42,198 @@ import datetime # Assuming Message model uses datetime
 ORCHESTRATOR_SYSTEM_PROMPT = "ORCHESTRATOR_SYSTEM_PROMPT_PLACEHOLDER"
 AVAILABLE_TOOLS_AND_LLMS = {"tools": [], "llms": []} # Placeholder
 
-# Hypothetical Ollama call function
-def call_ollama(model_name, prompt, history=None):
+# When OLLAMA_HOST is set, call_ollama talks to a real Ollama server; otherwise it simulates responses.
+# Run the server with OLLAMA_NUM_PARALLEL > 1 so concurrent chats are served in parallel rather than queued.
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+OLLAMA_KEEP_ALIVE = "30m" # Keep models (and their prompt KV cache) resident between requests
+# Routing is a small classification task, so it can run on a quantized build (see ollama_setup.sh)
+# with a capped context and reply length, which bounds its KV cache. The static prompt prefix alone
+# (system prompt + tool list) is over 2k tokens: with a smaller window Ollama truncates the front of
+# every prompt, which drops routing instructions and means the cached prefix can never be reused.
+ORCHESTRATOR_MODEL = os.environ.get("PSI_ORCHESTRATOR_MODEL", "mistral")
+ORCHESTRATOR_OPTIONS = {"num_ctx": 4096, "num_predict": 256}
+# One pooled httpx connection set (HTTP/2 where the server negotiates it) shared by every call
+OLLAMA_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+_ollama_client = ollama.AsyncClient(host=OLLAMA_HOST, http2=True, limits=OLLAMA_HTTP_LIMITS) if OLLAMA_HOST else None
+
+class OllamaDispatcher:
+    """
+    Runs Ollama client calls on one long-lived event loop, so the HTTP client's connection pool is shared
+    across Flask requests (each async view runs on its own loop). Calls are sent as soon as they arrive:
+    Ollama has no batch endpoint, so concurrent requests are served by the server's OLLAMA_NUM_PARALLEL slots.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="ollama-loop", daemon=True).start()
+
+    async def run(self, coro):
+        """Runs a client coroutine (chat, embeddings) on the shared loop; cancelling the caller cancels it there too."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def predict(self, model_name, messages, **chat_kwargs):
+        response = await self.run(self.client.chat(model=model_name, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE, **chat_kwargs))
+        return response['message']['content']
+
+    def stream(self, model_name, messages):
+        """Yields response text chunks as Ollama generates them (blocking iterator for Flask streaming)."""
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async for part in await self.client.chat(model=model_name, messages=messages, stream=True, keep_alive=OLLAMA_KEEP_ALIVE):
+                    chunks.put(part['message']['content'])
+            finally:
+                chunks.put(None)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while (chunk := chunks.get()) is not None:
+                yield chunk
+            future.result() # Re-raise any error from the stream
+        finally:
+            # The client went away (Flask closed the generator): stop pumping and close the HTTP stream
+            future.cancel()
+
+# PSI_OLLAMA_PROCESSES=N sends Ollama calls through N worker processes running the blocking client
+# instead of the async dispatcher, for deployments where the async client cannot be used.
+OLLAMA_PROCESSES = int(os.environ.get("PSI_OLLAMA_PROCESSES", "0"))
+_process_client = None # Per worker process
+
+def _worker_client():
+    global _process_client
+    if _process_client is None:
+        _process_client = ollama.Client(host=OLLAMA_HOST)
+    return _process_client
+
+def _chat_in_process(model_name, messages, **chat_kwargs):
+    # Module-level so the process pool can pickle it
+    response = _worker_client().chat(model=model_name, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE, **chat_kwargs)
+    return response['message']['content']
+
+def _embed_in_process(text):
+    return list(_worker_client().embeddings(model=EMBEDDING_MODEL, prompt=text)['embedding'])
+
+if _ollama_client and OLLAMA_PROCESSES > 0:
+    _ollama_process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=OLLAMA_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    _ollama_dispatcher = None
+else:
+    _ollama_process_pool = None
+    _ollama_dispatcher = OllamaDispatcher(_ollama_client) if _ollama_client else None
+
+# --- Semantic response cache ---
+# Near-duplicate prompts within a chat reuse the earlier answer instead of another LLM round trip.
+EMBEDDING_MODEL = "all-minilm" # all-MiniLM-L6-v2
+EMBEDDING_DIM = 256 # Size of the simulated embedding
+SEMANTIC_CACHE_THRESHOLD = 0.95 # Minimum cosine similarity for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = 256 # Per cache scope
+SEMANTIC_CACHE_MAX_SCOPES = 1024 # Least recently used scopes (e.g. idle chats) are evicted beyond this
+# scope -> ((N, D) embeddings, N responses, N history digests, N exact-match texts). Each scope's tuple is replaced
+# whole under the lock, so a concurrent reader (async views run on different threads) never sees the parts at
+# different lengths. An exact-match text is None for entries that any similar enough text may reuse.
+_SEMANTIC_CACHE = OrderedDict()
+_SEMANTIC_CACHE_LOCK = threading.Lock()
+
+def _history_digest(history):
+    # A reply depends on the conversation before the prompt, so a hit also requires the same history
+    return hashlib.blake2b(orjson.dumps(history or []), digest_size=16).digest()
+
+def _hashed_embedding(text):
+    """Cheap stand-in embedding: L2-normalised hashed bag of words."""
+    vec = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in re.findall(r"\w+", text.lower()):
+        vec[zlib.crc32(token.encode()) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+async def embed_text(text):
+    """Returns an L2-normalised embedding for text (Ollama when configured, simulated otherwise)."""
+    if _ollama_process_pool is not None:
+        embedding = await asyncio.wrap_future(_ollama_process_pool.submit(_embed_in_process, text))
+    elif _ollama_dispatcher is not None:
+        embedding = (await _ollama_dispatcher.run(_ollama_client.embeddings(model=EMBEDDING_MODEL, prompt=text)))['embedding']
+    else:
+        return _hashed_embedding(text)
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def semantic_cache(func):
+    """
+    Caches an LLM coroutine's responses by embedding similarity.
+    Callers opt in with cache_scope (e.g. (chat_id, "orchestrator")) and, optionally, cache_text to
+    embed instead of the full prompt. Calls without a scope go straight to the wrapped function.
+    Only entries cached with the same `history` (or cache_context, when the history is part of the prompt
+    itself) can answer a call. Responses for which cache_exact_if(response) is true are only reused for
+    the identical text.
+    """
+    @functools.wraps(func)
+    async def wrapper(model_name, prompt, cache_scope=None, cache_text=None, cache_context=None, cache_exact_if=None, **kwargs):
+        if cache_scope is None:
+            return await func(model_name, prompt, **kwargs)
+
+        text = cache_text if cache_text is not None else prompt
+        query = await embed_text(text)
+        digest = _history_digest(cache_context if cache_context is not None else kwargs.get("history"))
+        cached = _SEMANTIC_CACHE.get(cache_scope)
+        if cached is not None:
+            embeddings, responses, digests, exact_texts = cached
+            usable = [d == digest and (t is None or t == text) for d, t in zip(digests, exact_texts)]
+            scores = np.where(usable, embeddings @ query, -1.0)
+            best = int(np.argmax(scores))
+            if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+                logger.info("Semantic cache hit for %s (similarity %.3f)", cache_scope, scores[best])
+                with _SEMANTIC_CACHE_LOCK:
+                    if cache_scope in _SEMANTIC_CACHE:
+                        _SEMANTIC_CACHE.move_to_end(cache_scope)
+                return responses[best]
+
+        response = await func(model_name, prompt, **kwargs)
+        exact_text = text if cache_exact_if is not None and cache_exact_if(response) else None
+        with _SEMANTIC_CACHE_LOCK:
+            cached = _SEMANTIC_CACHE.get(cache_scope)
+            if cached is None:
+                entry = (query[np.newaxis, :], [response], [digest], [exact_text])
+            else:
+                embeddings, responses, digests, exact_texts = cached
+                entry = (np.vstack([embeddings, query]), [*responses, response], [*digests, digest], [*exact_texts, exact_text])
+            _SEMANTIC_CACHE[cache_scope] = tuple(part[-SEMANTIC_CACHE_MAX_ENTRIES:] for part in entry)
+            _SEMANTIC_CACHE.move_to_end(cache_scope)
+            while len(_SEMANTIC_CACHE) > SEMANTIC_CACHE_MAX_SCOPES:
+                _SEMANTIC_CACHE.popitem(last=False)
+        return response
+    return wrapper
+
+# Hypothetical Ollama call function (coroutine, so the route can overlap I/O-bound LLM calls)
+@semantic_cache
+async def call_ollama(model_name, prompt, history=None, json_schema=None, options=None):
+    """
+    json_schema, if given, constrains Ollama's decoding so the reply is always JSON matching it.
+    options are Ollama runtime options (e.g. num_ctx, num_predict).
+    """
     print(f"Attempting to call Ollama with model: {model_name}")
+    messages = list(history or []) + [{"role": "user", "content": prompt}]
+    if _ollama_process_pool is not None:
+        return await asyncio.wrap_future(_ollama_process_pool.submit(_chat_in_process, model_name, messages, format=json_schema, options=options))
+    if _ollama_dispatcher is not None:
+        return await _ollama_dispatcher.predict(model_name, messages, format=json_schema, options=options)
+    return _simulate_ollama(model_name, prompt)
+
+def stream_ollama(model_name, prompt, history=None):
+    """Yields the response text in chunks as it is generated (word by word when simulated)."""
+    print(f"Attempting to stream from Ollama with model: {model_name}")
+    messages = list(history or []) + [{"role": "user", "content": prompt}]
+    if _ollama_process_pool is not None: # Worker processes return the whole reply at once
+        yield _ollama_process_pool.submit(_chat_in_process, model_name, messages).result()
+        return
+    if _ollama_dispatcher is not None:
+        yield from _ollama_dispatcher.stream(model_name, messages)
+        return
+    yield from re.findall(r"\S+\s*", _simulate_ollama(model_name, prompt))
+
+def _simulate_ollama(model_name, prompt):
     # Simulate LLM call
-    if model_name == "mistral" and "ORCHESTRATOR_SYSTEM_PROMPT_PLACEHOLDER" in prompt:
+    if model_name == ORCHESTRATOR_MODEL and "ORCHESTRATOR_SYSTEM_PROMPT_PLACEHOLDER" in prompt:
         # Simulate orchestrator response
         if "read test.txt" in prompt:
             return json.dumps({
@@ -62,37 +281,175 @@ def write_file_tool(filename, content):
     # Simulate file writing
     return {"success": True, "message": f"Content written to '{filename}'.", "error": None}
 
+# --- Similarity kernel for document analysis ---
+def _cosine_topk_numpy(query_vec, doc_mat, k):
+    norms = np.sqrt(np.einsum("ij,ij->i", doc_mat, doc_mat)) * np.sqrt(np.dot(query_vec, query_vec))
+    scores = np.where(norms > 0, doc_mat @ query_vec / np.where(norms > 0, norms, 1), 0)
+    return np.argsort(-scores)[:k]
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _cosine_topk(query_vec, doc_mat, k):
+        """Indices of the k rows of doc_mat most cosine-similar to query_vec (compiled, parallel over rows)."""
+        n, d = doc_mat.shape
+        q_norm = 0.0
+        for j in range(d):
+            q_norm += query_vec[j] * query_vec[j]
+        q_norm = np.sqrt(q_norm)
+        scores = np.zeros(n, dtype=np.float32)
+        for i in prange(n):
+            dot = 0.0
+            row_norm = 0.0
+            for j in range(d):
+                dot += doc_mat[i, j] * query_vec[j]
+                row_norm += doc_mat[i, j] * doc_mat[i, j]
+            denom = np.sqrt(row_norm) * q_norm
+            if denom > 0:
+                scores[i] = dot / denom
+        return np.argsort(-scores)[:k]
+else:
+    _cosine_topk = _cosine_topk_numpy
+
+def _warmup_cosine_topk():
+    """Compiles (or loads the cached) kernel so the first request doesn't pay JIT time."""
+    _cosine_topk(np.ones(EMBEDDING_DIM, dtype=np.float32), np.ones((2, EMBEDDING_DIM), dtype=np.float32), 1)
+
 def document_analysis_tool(filename=None, document_content=None, analysis_query=None):
     doc_source = filename if filename else "provided text"
     if not doc_source and not document_content:
         return {"success": False, "result": None, "error": "No document provided for analysis."}
-    return {"success": True, "result": f"Analysis of '{doc_source}' for query '{analysis_query}': Key insights found.", "error": None}
+    result = f"Analysis of '{doc_source}' for query '{analysis_query}': Key insights found."
+    if document_content and analysis_query:
+        paragraphs = [p.strip() for p in document_content.split("\n\n") if p.strip()]
+        if paragraphs:
+            doc_mat = np.stack([_hashed_embedding(p) for p in paragraphs])
+            top = _cosine_topk(_hashed_embedding(analysis_query), doc_mat, 3)
+            result += " Most relevant passages: " + " | ".join(paragraphs[i] for i in top)
+    return {"success": True, "result": result, "error": None}
+
+# Typed orchestrator output, decoded straight from the raw JSON response
+class OrchestratorDecision(msgspec.Struct):
+    action_type: Literal["tool_call", "llm_call"]
+    details: dict
+
+_decode_orchestrator_decision = msgspec.json.Decoder(OrchestratorDecision)
+# Inline JSON schema passed to Ollama as `format`, so the orchestrator is grammar-constrained to emit a valid decision
+ORCHESTRATOR_DECISION_SCHEMA = msgspec.json.schema_components([OrchestratorDecision])[1]["OrchestratorDecision"]
+_TRAILING_COMMA_RE = re.compile(rb",\s*([}\]])")
+
+def _salvage_json(raw):
+    """Strips a Markdown code fence and trailing commas, the usual reasons an LLM's JSON fails to parse."""
+    raw = raw.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    return _TRAILING_COMMA_RE.sub(rb"\1", raw.strip().encode())
+
+def decode_orchestrator_decision(raw):
+    """Decodes the orchestrator's reply, retrying once on a cleaned-up copy before giving up."""
+    try:
+        return _decode_orchestrator_decision.decode(raw)
+    except msgspec.DecodeError:
+        return _decode_orchestrator_decision.decode(_salvage_json(raw)) # Still raises if it cannot be salvaged
+
+def _is_tool_call_decision(raw):
+    # Tool calls carry arguments taken from the message (filename, content, analysis_query) that a
+    # near-duplicate message may not share, so the semantic cache only reuses them for the same message
+    try:
+        return decode_orchestrator_decision(raw).action_type != "llm_call"
+    except msgspec.DecodeError:
+        return True
+
+# Side effects of each tool: only "reads" tools may overlap with other in-flight work
+TOOL_ACCESS_MODES = {
+    "read_file": "reads",
+    "write_file": "writes",
+    "document_analysis": "reads",
+}
+
+async def run_tool(tool_name, tool_function, *args, **kwargs):
+    """Runs conflict-free (read-only) tools off the event loop; writing tools run inline."""
+    if TOOL_ACCESS_MODES.get(tool_name) == "reads":
+        return await asyncio.to_thread(tool_function, *args, **kwargs)
+    return tool_function(*args, **kwargs)
+
+def _matches_user_message(sub_prompt, user_message_content):
+    """True when the orchestrator's sub-prompt is just the user message (modulo whitespace/case)."""
+    return " ".join(sub_prompt.split()).lower() == " ".join(user_message_content.split()).lower()
+
+# Speculating costs a full mistral generation whenever the orchestrator routes elsewhere, so it is only
+# started for messages that look like plain conversation. PSI_SPECULATIVE_LLM=0 turns it off entirely.
+SPECULATIVE_LLM_ENABLED = os.environ.get("PSI_SPECULATIVE_LLM", "1") != "0"
+# Words and shapes that usually mean a tool call, a document task or the code model
+_NOT_GENERAL_CHAT_RE = re.compile(
+    r"\b(?:read|write|save|open|file|files|document|doc|pdf|analy[sz]e|summari[sz]e|code|coding|function|script|debug|python|javascript)\b"
+    r"|\w\.[a-z0-9]{2,4}\b|```",
+    re.I,
+)
+
+def _worth_speculating(user_message_content):
+    return SPECULATIVE_LLM_ENABLED and not _NOT_GENERAL_CHAT_RE.search(user_message_content)
 
 # Placeholder database models and functions
-class Message: # Simplified representation
-    def __init__(self, user_id, chat_id, content, role, agent_action=None, tool_details=None, system_info_message=None, timestamp=None):
-        self.user_id = user_id
-        self.chat_id = chat_id
-        self.content = content
-        self.role = role # 'user', 'assistant', 'system'
-        self.agent_action = agent_action
-        self.tool_details = tool_details # JSON string or dict
-        self.system_info_message = system_info_message
-        self.timestamp = timestamp or datetime.datetime.utcnow()
+class Message(msgspec.Struct): # Simplified representation; slotted, so no per-instance __dict__
+    user_id: Any
+    chat_id: Any
+    content: str
+    role: str # 'user', 'assistant', 'system'
+    agent_action: Optional[str] = None
+    tool_details: Any = None # JSON bytes or dict
+    system_info_message: Optional[str] = None
+    timestamp: int = msgspec.field(default_factory=time.time_ns) # Epoch nanoseconds; formatted only on output
 
     def to_dict(self): # To simulate how it might be stored or returned
-        return self.__dict__
+        message_dict = msgspec.structs.asdict(self)
+        message_dict["timestamp"] = datetime.datetime.fromtimestamp(self.timestamp / 1e9, tz=datetime.timezone.utc).isoformat()
+        return message_dict
 
 # Placeholder DB interaction
 DB_MESSAGES = [] # In-memory list to simulate DB
+CHAT_INDEX_MAXLEN = 256 # Most recent messages kept per chat for history lookups
+_CHAT_INDEX = defaultdict(lambda: deque(maxlen=CHAT_INDEX_MAXLEN)) # chat_id -> messages in insertion (chronological) order
+ORCHESTRATOR_HISTORY_TURNS = 5 # Condensed user/assistant turns shown to the orchestrator
+_HISTORY_CACHE = defaultdict(lambda: deque(maxlen=ORCHESTRATOR_HISTORY_TURNS)) # chat_id -> pre-serialized turns
+
+CONVERSATION_ROLES = frozenset(('user', 'assistant')) # Roles that make up the dialogue shown to LLMs
+
+def _serialize_turn(message_obj):
+    return orjson.dumps({"role": message_obj.role, "content": message_obj.content}).decode()
+
+def add_messages_to_db(message_objs):
+    # One round trip for several messages
+    DB_MESSAGES.extend(message_objs)
+    for message_obj in message_objs:
+        _CHAT_INDEX[message_obj.chat_id].append(message_obj)
+        if message_obj.role in CONVERSATION_ROLES:
+            _HISTORY_CACHE[message_obj.chat_id].append(_serialize_turn(message_obj))
+        print(f"DB: Added message - Role: {message_obj.role}, Content: {message_obj.content}, Action: {message_obj.agent_action}")
 
 def add_message_to_db(message_obj):
-    DB_MESSAGES.append(message_obj)
-    print(f"DB: Added message - Role: {message_obj.role}, Content: {message_obj.content}, Action: {message_obj.agent_action}")
+    add_messages_to_db([message_obj])
+
+class MessageBuffer:
+    """Collects the messages produced while handling a request and writes them to the DB in one flush."""
+    def __init__(self):
+        self.pending = []
+
+    def add(self, message_obj):
+        self.pending.append(message_obj)
+
+    def flush(self):
+        if self.pending:
+            add_messages_to_db(self.pending)
+            self.pending = []
+
+def get_serialized_history(chat_id, pending_message=None):
+    """JSON array of the last few user/assistant turns, built from turns serialized once at insert time."""
+    turns = list(_HISTORY_CACHE[chat_id])
+    if pending_message is not None:
+        turns = (turns + [_serialize_turn(pending_message)])[-ORCHESTRATOR_HISTORY_TURNS:]
+    return "[" + ",".join(turns) + "]"
 
 def get_chat_history_from_db(chat_id, limit=10):
-    # Simulate fetching and ordering history
-    return sorted([m for m in DB_MESSAGES if m.chat_id == chat_id], key=lambda x: x.timestamp, reverse=True)[:limit]
+    # Newest first, read from the per-chat index instead of scanning and sorting DB_MESSAGES
+    return list(islice(reversed(_CHAT_INDEX[chat_id]), limit))
 
 # --- End of Placeholders ---
 
@@ -102,8 +459,55 @@ def get_chat_history_from_db(chat_id, limit=10):
 # For this task, let's assume it's part of a Blueprint.
 api_chat_blueprint = Blueprint('api_chat', __name__)
 
+# Static parts of the orchestrator prompt. The system prompt and tool/LLM listing never change between
+# requests, so they are serialized once; keeping them byte-identical also lets Ollama reuse the prefix KV cache.
+_ORCH_SUFFIX = "\n\n\nBased on the user message, available tools, LLMs, and chat history, what is the next action? Respond in JSON format as specified in the system prompt."
+
+def _build_orchestrator_prefix():
+    return ORCHESTRATOR_SYSTEM_PROMPT + "\n\n\nAVAILABLE_TOOLS_AND_LLMS:\n" + orjson.dumps(AVAILABLE_TOOLS_AND_LLMS, option=orjson.OPT_INDENT_2).decode()
+
+_ORCH_PREFIX = _build_orchestrator_prefix()
+
+def render_orchestrator_prompt(history_json, user_message_content):
+    # A single f-string renders straight into one buffer, with no per-request list of parts
+    return f"{_ORCH_PREFIX}\n\n\nCHAT_HISTORY (condensed):\n{history_json}\n\n\nUSER_MESSAGE:\n{user_message_content}{_ORCH_SUFFIX}"
+
+@api_chat_blueprint.record_once
+def _warmup_similarity_kernel(state):
+    # Set PSI_NUMBA_WARMUP=0 to skip compiling the document-analysis kernel at startup
+    if os.environ.get("PSI_NUMBA_WARMUP", "1") != "0":
+        threading.Thread(target=_warmup_cosine_topk, name="numba-warmup", daemon=True).start()
+
+@api_chat_blueprint.record_once
+def _cache_orchestrator_prefix(state):
+    # Rebuild on registration in case the real prompt/tool definitions were injected after import
+    global _ORCH_PREFIX
+    _ORCH_PREFIX = _build_orchestrator_prefix()
+
+def _stream_llm_reply(user_id, chat_id, llm_model, sub_prompt, history, system_info_message_content):
+    """Server-Sent Events generator: forwards tokens as they arrive and saves the full reply once the stream completes."""
+    chunks = []
+    message_buffer = MessageBuffer()
+    agent_action = f"llm_{llm_model}_success"
+    try:
+        for chunk in stream_ollama(llm_model, sub_prompt, history=history):
+            chunks.append(chunk)
+            yield f"data: {orjson.dumps({'token': chunk}).decode()}\n\n"
+    except Exception as e:
+        print(f"Error streaming from target LLM {llm_model}: {e}")
+        agent_action = f"llm_{llm_model}_failed"
+        chunks = [f"Sorry, there was an error contacting the {llm_model} model."]
+        llm_fail_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=f"Failed to get response from {llm_model}: {e}", role='system', agent_action=agent_action)
+        message_buffer.add(llm_fail_msg_obj)
+        yield f"data: {orjson.dumps({'error': chunks[0]}).decode()}\n\n"
+
+    ai_message_obj = Message(user_id=user_id, chat_id=chat_id, content="".join(chunks), role='assistant', agent_action=agent_action, system_info_message=system_info_message_content)
+    message_buffer.add(ai_message_obj)
+    message_buffer.flush()
+    yield f"data: {orjson.dumps({'done': True, 'agent_action': agent_action, 'chat_id': chat_id, 'message_id': str(ai_message_obj.timestamp)}).decode()}\n\n"
+
 @api_chat_blueprint.route('/api/chat', methods=['POST'])
-def api_chat_route():
+async def api_chat_route():
     data = request.get_json()
     if not data:
         return jsonify({"error": "Invalid JSON payload"}), 400
@@ -111,74 +515,95 @@ def api_chat_route():
     user_id = data.get('user_id', 'default_user') # Assuming user_id is part of the request
     chat_id = data.get('chat_id', 'default_chat') # Assuming chat_id for session management
     user_message_content = data.get('message')
+    stream_requested = bool(data.get('stream')) # Stream LLM replies as Server-Sent Events
 
     if not user_message_content:
         return jsonify({"error": "Missing 'message' in request"}), 400
 
-    # 1. Save user message to DB
+    # 1. Save user message to DB (messages are buffered and written in one flush before responding)
+    message_buffer = MessageBuffer()
     user_message_obj = Message(user_id=user_id, chat_id=chat_id, content=user_message_content, role='user')
-    add_message_to_db(user_message_obj)
+    message_buffer.add(user_message_obj)
 
     # 2. Retrieve chat history (condensed for orchestrator)
     # For the orchestrator, we might want a very concise history, e.g., last few turns.
     # For the target LLM, we might want a more complete history.
-    raw_history = get_chat_history_from_db(chat_id, limit=10) # Get more for target LLM
-
-    # Condense history for orchestrator: e.g., just user/assistant messages
-    condensed_history_for_orchestrator = []
-    for msg_obj in reversed(raw_history): # chronological
-        if msg_obj.role in ['user', 'assistant']:
-            condensed_history_for_orchestrator.append({"role": msg_obj.role, "content": msg_obj.content})
-
-    # History for target LLMs (could be different, more detailed)
-    history_for_target_llm = condensed_history_for_orchestrator # Keep it same for this example
+    # History for target LLMs: user/assistant messages in one pass over the newest-first history, then put in chronological order.
+    # The current user message is still buffered, so it isn't included: call_ollama/stream_ollama append the
+    # prompt (the user message or the orchestrator's sub-prompt) as the final user turn themselves.
+    history_for_target_llm = [
+        {"role": msg_obj.role, "content": msg_obj.content}
+        for msg_obj in get_chat_history_from_db(chat_id, limit=9) # Get more for target LLM
+        if msg_obj.role in CONVERSATION_ROLES
+    ][::-1]
 
     # 3. Construct prompt for Orchestrator LLM
-    orchestrator_prompt_parts = [
-        ORCHESTRATOR_SYSTEM_PROMPT,
-        "\n\nAVAILABLE_TOOLS_AND_LLMS:\n" + json.dumps(AVAILABLE_TOOLS_AND_LLMS, indent=2),
-        "\n\nCHAT_HISTORY (condensed):\n" + json.dumps(condensed_history_for_orchestrator[-5:]), # last 5 exchanges
-        "\n\nUSER_MESSAGE:\n" + user_message_content,
-        "\n\nBased on the user message, available tools, LLMs, and chat history, what is the next action? Respond in JSON format as specified in the system prompt."
-    ]
-    orchestrator_prompt = "\n".join(orchestrator_prompt_parts)
+    orchestrator_prompt = render_orchestrator_prompt(
+        get_serialized_history(chat_id, pending_message=user_message_obj), # last 5 exchanges
+        user_message_content
+    )
+    # The decision depends on the history embedded in the prompt, so cached decisions are keyed on it
+    # (without the pending message, which is what the cache compares by similarity)
+    orchestrator_cache_context = get_serialized_history(chat_id)
 
     # 4. Call Orchestrator LLM
     ai_response_text = "An error occurred." # Default response
     agent_action = "orchestrator_mistral_failed"
+    action_type = None
     tool_details_for_response = None
     system_info_message_content = None # For messages like "Orchestrator selected..."
 
+    # For plain conversation, speculatively start the general mistral answer alongside the orchestrator. It is used if the
+    # orchestrator routes the plain user message to mistral (or we fall back to it), otherwise cancelled, which
+    # cancels the call on the dispatcher loop and closes its HTTP request so Ollama stops generating.
+    # The orchestrator decision and the downstream answers are cached separately, so a partial hit still saves a round trip.
+    orchestrator_task = asyncio.create_task(call_ollama(ORCHESTRATOR_MODEL, orchestrator_prompt, history=[], json_schema=ORCHESTRATOR_DECISION_SCHEMA, options=ORCHESTRATOR_OPTIONS, cache_scope=(chat_id, "orchestrator"), cache_text=user_message_content, cache_context=orchestrator_cache_context, cache_exact_if=_is_tool_call_decision)) # History is already in the prompt
+    speculative_task = None
+    # Streamed replies are generated by _stream_llm_reply, so a speculative answer would always be thrown away
+    if not stream_requested and _worth_speculating(user_message_content):
+        speculative_task = asyncio.create_task(call_ollama("mistral", user_message_content, history=history_for_target_llm, cache_scope=(chat_id, "mistral")))
+
+    def general_answer():
+        # Awaitable for the general mistral answer: the speculative call if one is running, otherwise a new call
+        if speculative_task is not None:
+            return speculative_task
+        return call_ollama("mistral", user_message_content, history=history_for_target_llm, cache_scope=(chat_id, "mistral"))
+
+    def cancel_speculation():
+        if speculative_task is not None and not speculative_task.done():
+            speculative_task.cancel()
+
     try:
-        orchestrator_response_raw = call_ollama("mistral", orchestrator_prompt, history=[]) # Orchestrator usually doesn't need its own history
+        orchestrator_response_raw = await orchestrator_task
 
         # 5. Parse JSON response from orchestrator
         try:
-            orchestrator_decision = json.loads(orchestrator_response_raw)
-            action_type = orchestrator_decision.get("action_type")
-            details = orchestrator_decision.get("details", {})
+            orchestrator_decision = decode_orchestrator_decision(orchestrator_response_raw)
+            action_type = orchestrator_decision.action_type
+            details = orchestrator_decision.details
             agent_action = f"orchestrator_mistral_success_{action_type}"
 
-        except json.JSONDecodeError as e:
+        except msgspec.DecodeError as e: # Only reachable if the server ignores `format` (Ollama < 0.5)
             print(f"Error: Failed to parse orchestrator JSON response: {e}")
             print(f"Raw response was: {orchestrator_response_raw}")
             system_info_message_content = f"System Error: Orchestrator response was not valid JSON. Raw: {orchestrator_response_raw}"
-            # Fallback: call general LLM
-            ai_response_text = call_ollama("mistral", user_message_content, history=history_for_target_llm)
+            # Fallback: general LLM answer (already running if it was speculated)
+            ai_response_text = await general_answer()
             agent_action = "llm_mistral_fallback_json_error"
             # Save system error message
             system_error_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=system_info_message_content, role='system', agent_action='system_error')
-            add_message_to_db(system_error_msg_obj)
+            message_buffer.add(system_error_msg_obj)
 
 
         # 6. Implement logic based on parsed action_type
         if action_type == "tool_call":
+            cancel_speculation()
             tool_name = details.get("tool_name")
             system_info_message_content = f"Orchestrator selected tool: {tool_name}."
             print(system_info_message_content) # Log to console
             # Save system message about orchestrator decision
             orch_decision_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=system_info_message_content, role='system', agent_action=f"orchestrator_tool_{tool_name}")
-            add_message_to_db(orch_decision_msg_obj)
+            message_buffer.add(orch_decision_msg_obj)
 
             tool_output_message = "" # For the user
             tool_success_status = "failed"
@@ -186,7 +611,7 @@ def api_chat_route():
             if tool_name == "read_file":
                 filename = details.get("filename")
                 if filename:
-                    result = read_file_tool(filename)
+                    result = await run_tool(tool_name, read_file_tool, filename)
                     if result["success"]:
                         ai_response_text = f"Successfully read '{filename}'. Content:\n{result['content']}"
                         tool_output_message = f"Tool Used: read_file. File: {filename}. Status: Success."
@@ -203,7 +628,7 @@ def api_chat_route():
                 filename = details.get("filename")
                 content = details.get("content")
                 if filename and content is not None:
-                    result = write_file_tool(filename, content)
+                    result = await run_tool(tool_name, write_file_tool, filename, content)
                     if result["success"]:
                         ai_response_text = f"Successfully wrote to '{filename}'."
                         tool_output_message = f"Tool Used: write_file. File: {filename}. Status: Success."
@@ -221,7 +646,7 @@ def api_chat_route():
                 doc_content = details.get("document_content") # Orchestrator might pass this
                 analysis_query = details.get("analysis_query")
                 if (filename or doc_content) and analysis_query:
-                    result = document_analysis_tool(filename=filename, document_content=doc_content, analysis_query=analysis_query)
+                    result = await run_tool(tool_name, document_analysis_tool, filename=filename, document_content=doc_content, analysis_query=analysis_query)
                     if result["success"]:
                         ai_response_text = f"Document Analysis Result: {result['result']}"
                         tool_output_message = f"Tool Used: document_analysis. Source: {filename if filename else 'text'}. Query: {analysis_query}. Status: Success."
@@ -240,7 +665,7 @@ def api_chat_route():
             agent_action = f"tool_{tool_name}_{tool_success_status}"
             # Save tool usage system message
             tool_usage_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=tool_output_message, role='system', agent_action=agent_action, tool_details=tool_details_for_response)
-            add_message_to_db(tool_usage_msg_obj)
+            message_buffer.add(tool_usage_msg_obj)
 
 
         elif action_type == "llm_call":
@@ -250,11 +675,22 @@ def api_chat_route():
             print(system_info_message_content) # Log to console
             # Save system message about orchestrator decision
             orch_decision_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=system_info_message_content, role='system', agent_action=f"orchestrator_llm_{llm_model}")
-            add_message_to_db(orch_decision_msg_obj)
-
-            if llm_model and sub_prompt:
+            message_buffer.add(orch_decision_msg_obj)
+
+            if llm_model and sub_prompt and stream_requested:
+                cancel_speculation()
+                message_buffer.flush()
+                return Response(
+                    stream_with_context(_stream_llm_reply(user_id, chat_id, llm_model, sub_prompt, history_for_target_llm, system_info_message_content)),
+                    mimetype='text/event-stream'
+                )
+            elif llm_model and sub_prompt:
                 try:
-                    ai_response_text = call_ollama(llm_model, sub_prompt, history=history_for_target_llm)
+                    if llm_model == "mistral" and _matches_user_message(sub_prompt, user_message_content):
+                        ai_response_text = await general_answer()
+                    else:
+                        cancel_speculation()
+                        ai_response_text = await call_ollama(llm_model, sub_prompt, history=history_for_target_llm, cache_scope=(chat_id, llm_model))
                     agent_action = f"llm_{llm_model}_success"
                 except Exception as e:
                     print(f"Error calling target LLM {llm_model}: {e}")
@@ -262,12 +698,12 @@ def api_chat_route():
                     agent_action = f"llm_{llm_model}_failed"
                     # Save system error message for this failure
                     llm_fail_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=f"Failed to get response from {llm_model}: {e}", role='system', agent_action=agent_action)
-                    add_message_to_db(llm_fail_msg_obj)
+                    message_buffer.add(llm_fail_msg_obj)
             else:
                 ai_response_text = "Error: LLM model or sub-prompt not specified by orchestrator."
                 agent_action = "llm_call_missing_details"
                 # Fallback to general LLM if details are missing
-                ai_response_text = call_ollama("mistral", user_message_content, history=history_for_target_llm)
+                ai_response_text = await general_answer()
                 agent_action = "llm_mistral_fallback_bad_orchestrator_llm_call"
 
 
@@ -279,10 +715,10 @@ def api_chat_route():
             print(system_info_message_content)
             # Save system error message
             unrec_action_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=system_info_message_content, role='system', agent_action='orchestrator_unrecognized_action')
-            add_message_to_db(unrec_action_msg_obj)
+            message_buffer.add(unrec_action_msg_obj)
 
             # Fallback to general LLM
-            ai_response_text = call_ollama("mistral", user_message_content, history=history_for_target_llm)
+            ai_response_text = await general_answer()
             agent_action = "llm_mistral_fallback_unrecognized_action"
 
 
@@ -292,7 +728,9 @@ def api_chat_route():
         agent_action = "chat_api_exception"
         # Save system error message
         api_err_msg_obj = Message(user_id=user_id, chat_id=chat_id, content=f"API Exception: {e}", role='system', agent_action=agent_action)
-        add_message_to_db(api_err_msg_obj)
+        message_buffer.add(api_err_msg_obj)
+    finally:
+        cancel_speculation()
 
     # 7. Save AI response to DB
     ai_message_obj = Message(
@@ -301,10 +739,11 @@ def api_chat_route():
         content=ai_response_text,
         role='assistant',
         agent_action=agent_action,
-        tool_details=json.dumps(tool_details_for_response) if tool_details_for_response else None,
+        tool_details=orjson.dumps(tool_details_for_response) if tool_details_for_response else None, # Stored as JSON bytes
         system_info_message=system_info_message_content # This is more for the AI's own message if it's a system response
     )
-    add_message_to_db(ai_message_obj)
+    message_buffer.add(ai_message_obj)
+    message_buffer.flush()
 
     # 8. Return response to frontend
     response_payload = {
@@ -1,18 +1,156 @@
 import os
 import sys
+import ast
+import concurrent.futures
+import functools
 import importlib
+import importlib.util
 import inspect
 import json
 import logging
+import pickle
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
 
+# On-disk cache of discovered tool schemas, reused while the tools directory is unchanged.
+# Bump TOOLS_CACHE_VERSION when the scanner changes what it can resolve, so stale results are dropped.
+TOOLS_CACHE_PATH = os.path.expanduser("~/.cache/agent_core/tools.pkl")
+TOOLS_CACHE_VERSION = 2
+
+def _is_tool_module(filename):
+    return filename.endswith(".py") and not filename.startswith("_")
+
+def _tools_dir_signature(abs_tools_dir):
+    """(filename, mtime_ns) for every tool module; changes whenever a tool file is added, removed or edited."""
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns)
+        for entry in os.scandir(abs_tools_dir)
+        if entry.is_file() and _is_tool_module(entry.name)
+    ))
+
+@functools.lru_cache(maxsize=None)
+def _load_tool_module(module_name, path):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logging.info(f"Lazily imported tool module: {module_name}")
+    return module
+
+class ToolRef:
+    """Callable handle for a tool function whose module is only imported on first use."""
+
+    def __init__(self, module_name, func_name, path):
+        self.module_name = module_name
+        self.func_name = func_name
+        self.path = path
+
+    def resolve(self):
+        return getattr(_load_tool_module(self.module_name, self.path), self.func_name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"ToolRef({self.module_name}.{self.func_name})"
+
+def _literal_schema(node):
+    """Evaluates a `func.tool_schema = ...` value written as a dict/str literal or json.dumps(<literal>)."""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "dumps"
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == "json"
+            and len(node.args) == 1 and not node.keywords):
+        node = node.args[0]
+    return ast.literal_eval(node)
+
+def _scan_tool_module(path):
+    """
+    Finds tool functions and their schemas by parsing the module source, without executing it.
+    Returns None if the module cannot be resolved statically and has to be imported instead: a schema
+    built at runtime, a decorated function (e.g. @tool(...), which may attach a schema), or any other
+    use of tool_schema (setattr, assignments inside if-blocks or functions).
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return None
+
+    function_nodes = [node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    if any(node.decorator_list for node in function_nodes):
+        return None
+    functions = {node.name for node in function_nodes}
+    schemas = {}
+    resolved_assignments = 0
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if (isinstance(target, ast.Attribute) and target.attr == "tool_schema"
+                and isinstance(target.value, ast.Name) and target.value.id in functions):
+            try:
+                schemas[target.value.id] = _literal_schema(node.value)
+            except ValueError: # Schema built at runtime
+                return None
+            resolved_assignments += 1
+
+    # Every mention of tool_schema must be one of the literal assignments above
+    mentions = sum(
+        1 for node in ast.walk(tree)
+        if (isinstance(node, ast.Attribute) and node.attr == "tool_schema")
+        or (isinstance(node, ast.Constant) and node.value == "tool_schema")
+    )
+    if mentions != resolved_assignments:
+        return None
+    return schemas
+
+def _normalize_schema(name, module_name, schema):
+    # Ensure schema is a dictionary if it's a JSON string
+    if isinstance(schema, str):
+        try:
+            return json.loads(schema)
+        except json.JSONDecodeError as e:
+            logging.error(f"Failed to parse JSON schema for tool {name} in {module_name}: {e}")
+            return {"error": "Invalid JSON schema"}
+    elif isinstance(schema, dict):
+        return schema
+    logging.error(f"Tool schema for {name} in {module_name} is neither a string nor a dict.")
+    return {"error": "Schema is not in a recognizable format"}
+
+def _load_tools_cache(abs_tools_dir, signature):
+    try:
+        with open(TOOLS_CACHE_PATH, "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        return None
+    if (cached.get("version") != TOOLS_CACHE_VERSION or cached.get("tools_dir") != abs_tools_dir
+            or cached.get("signature") != signature):
+        return None
+    return cached
+
+def _save_tools_cache(abs_tools_dir, signature, tool_modules, tool_schemas):
+    try:
+        os.makedirs(os.path.dirname(TOOLS_CACHE_PATH), exist_ok=True)
+        with open(TOOLS_CACHE_PATH, "wb") as f:
+            pickle.dump({
+                "version": TOOLS_CACHE_VERSION,
+                "tools_dir": abs_tools_dir,
+                "signature": signature,
+                "modules": tool_modules,
+                "schemas": tool_schemas,
+            }, f)
+    except (OSError, pickle.PickleError) as e:
+        logging.warning(f"Could not write tools cache '{TOOLS_CACHE_PATH}': {e}")
+
 def discover_tools(tools_dir):
     """
     Discovers tools (functions and their JSON schemas) from Python files
     in the specified directory.
 
+    Tool modules are parsed rather than imported wherever their schemas are literals,
+    and results are cached in memory and on disk, keyed by the modification times of
+    the tool modules. Such tools are returned as ToolRef handles that import their
+    module on first call.
+
     Args:
         tools_dir (str): The path to the directory containing tool modules.
 
@@ -21,49 +159,66 @@ def discover_tools(tools_dir):
             - dict: A dictionary mapping tool function names to the functions themselves.
             - dict: A dictionary mapping tool function names to their JSON schemas.
     """
-    tool_functions = {}
-    tool_schemas = {}
     abs_tools_dir = os.path.abspath(tools_dir)
 
     if not os.path.isdir(abs_tools_dir):
         logging.warning(f"Tools directory '{abs_tools_dir}' not found.")
-        return tool_functions, tool_schemas
+        return {}, {}
 
     # Ensure the tools directory is in sys.path to allow direct module imports
     if abs_tools_dir not in sys.path:
         sys.path.insert(0, abs_tools_dir)
         logging.info(f"Added '{abs_tools_dir}' to sys.path for tool discovery.")
 
-    for filename in os.listdir(abs_tools_dir):
-        if filename.endswith(".py") and not filename.startswith("_"):
-            module_name = filename[:-3]
-            try:
-                # Import the module directly by its name, as it's now in sys.path
-                module = importlib.import_module(module_name)
-                logging.info(f"Successfully imported module: {module_name}")
-
-                for name, func in inspect.getmembers(module, inspect.isfunction):
-                    if hasattr(func, 'tool_schema'):
-                        logging.info(f"Found tool function: {name} in {module_name}")
-                        tool_functions[name] = func
-                        # Ensure schema is a dictionary if it's a JSON string
-                        schema = func.tool_schema
-                        if isinstance(schema, str):
-                            try:
-                                tool_schemas[name] = json.loads(schema)
-                            except json.JSONDecodeError as e:
-                                logging.error(f"Failed to parse JSON schema for tool {name} in {module_name}: {e}")
-                                tool_schemas[name] = {"error": "Invalid JSON schema"}
-                        elif isinstance(schema, dict):
-                            tool_schemas[name] = schema
-                        else:
-                            logging.error(f"Tool schema for {name} in {module_name} is neither a string nor a dict.")
-                            tool_schemas[name] = {"error": "Schema is not in a recognizable format"}
-
-            except ImportError as e:
-                logging.error(f"Failed to import module {module_name}: {e}")
-            except Exception as e:
-                logging.error(f"An unexpected error occurred while processing {module_name}: {e}")
+    tool_functions, tool_schemas = _discover(abs_tools_dir, _tools_dir_signature(abs_tools_dir))
+    return dict(tool_functions), dict(tool_schemas)
+
+@functools.lru_cache(maxsize=8)
+def _discover(abs_tools_dir, signature):
+    cached = _load_tools_cache(abs_tools_dir, signature)
+    if cached is not None:
+        logging.info(f"Loaded {len(cached['schemas'])} tool schemas from cache '{TOOLS_CACHE_PATH}'.")
+        tool_functions = {
+            name: ToolRef(module_name, name, os.path.join(abs_tools_dir, module_name + ".py"))
+            for name, module_name in cached["modules"].items()
+        }
+        return tool_functions, cached["schemas"]
+
+    tool_functions = {}
+    tool_modules = {}
+    tool_schemas = {}
+
+    filenames = [filename for filename, _ in signature if _is_tool_module(filename)]
+    paths = [os.path.join(abs_tools_dir, filename) for filename in filenames]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        scanned_modules = list(pool.map(_scan_tool_module, paths))
+
+    for filename, path, scanned in zip(filenames, paths, scanned_modules):
+        module_name = filename[:-3]
+        if scanned is not None:
+            for name, schema in scanned.items():
+                logging.info(f"Found tool function: {name} in {module_name} (not imported)")
+                tool_functions[name] = ToolRef(module_name, name, path)
+                tool_modules[name] = module_name
+                tool_schemas[name] = _normalize_schema(name, module_name, schema)
+            continue
+
+        try:
+            # Import the module directly by its name, as it's now in sys.path
+            module = importlib.import_module(module_name)
+            logging.info(f"Successfully imported module: {module_name}")
+
+            for name, func in inspect.getmembers(module, inspect.isfunction):
+                if hasattr(func, 'tool_schema'):
+                    logging.info(f"Found tool function: {name} in {module_name}")
+                    tool_functions[name] = func
+                    tool_modules[name] = module_name
+                    tool_schemas[name] = _normalize_schema(name, module_name, func.tool_schema)
+
+        except ImportError as e:
+            logging.error(f"Failed to import module {module_name}: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred while processing {module_name}: {e}")
 
     # Clean up sys.path if added by this function, to avoid long-term pollution
     # However, for a running application, it might be intended to keep it for the app's lifetime.
@@ -73,6 +228,7 @@ def discover_tools(tools_dir):
     #     sys.path.pop(0)
     #     logging.info(f"Removed '{abs_tools_dir}' from sys.path after discovery.")
 
+    _save_tools_cache(abs_tools_dir, signature, tool_modules, tool_schemas)
     return tool_functions, tool_schemas
 
 if __name__ == '__main__':
@@ -1,28 +1,54 @@
 # backend/app.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, LargeBinary, Index, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import json
 import os
+import sys
+import hashlib
+import shelve
+import fcntl
+import tempfile
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 import threading
+import asyncio
 import ollama
+import numpy as np
+import orjson
+try:
+    import faiss
+except ImportError: # faiss is optional; knowledge-base retrieval falls back to the exact float32 scan
+    faiss = None
 from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel, Field
 import inspect
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///./test.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['KNOWLEDGE_BASE_PATH'] = 'knowledge_base' # New
+class OrjsonProvider(DefaultJSONProvider):
+    """Serves jsonify/request.get_json through orjson; types orjson can't encode go through Flask's default hook."""
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
 
-db = SQLAlchemy(app)
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+DEFAULT_CONFIG = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///./test.db',
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'UPLOAD_FOLDER': 'uploads',
+    'KNOWLEDGE_BASE_PATH': 'knowledge_base',
+}
+
+db = SQLAlchemy() # Bound to the app in create_app()
+api = Blueprint('api', __name__)
 
 # --- SQLAlchemy Models ---
 Base = declarative_base()
@@ -34,7 +60,8 @@ class AgentProfile(db.Model):
     persona = Column(Text, nullable=False, default="You are a helpful AI assistant.")
     tools = Column(JSON, nullable=True, default=[]) # Store tool definitions
     current_task_id = Column(Integer, ForeignKey('background_task.id'), nullable=True)
-    current_task = relationship("BackgroundTask", foreign_keys=[current_task_id])
+    # lazy='raise': no endpoint reads the task through the profile; load it explicitly (selectinload) if one ever does
+    current_task = relationship("BackgroundTask", foreign_keys=[current_task_id], lazy='raise')
     # New fields for agent state
     state = Column(JSON, default={}) # General purpose state
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -57,6 +84,15 @@ class BackgroundTask(db.Model): # New Model
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     agent_profile_id = Column(Integer, ForeignKey('agent_profile.id'), nullable=True) # Link to agent if needed
+    __table_args__ = (Index('ix_bgtask_status_updated', status, updated_at.desc()),) # Status-filtered polling
+
+class ResponseCacheEntry(db.Model): # Semantic cache of final chat responses
+    __tablename__ = 'response_cache_entry'
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(64), nullable=False, index=True) # Model + persona hash; editing the persona starts a fresh scope
+    embedding = Column(LargeBinary, nullable=False) # Normalized float32 prompt embedding
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 # --- Pydantic Models for API validation ---
 class Message(BaseModel): # Moved from script, standard Pydantic model
@@ -83,30 +119,63 @@ def discover_tools(module_or_object: Any) -> List[Dict[str, Any]]:
             })
     return discovered_tools
 
+def tool(schema_cls):
+    """Marks a function as an agent tool, precomputing its required arguments once."""
+    def wrap(func):
+        func.tool_schema = schema_cls
+        sig = inspect.signature(func)
+        func.required_args = frozenset(name for name, param in sig.parameters.items() if param.default is inspect.Parameter.empty)
+        return func
+    return wrap
+
+# --- Transactions ---
+_UNIT_OF_WORK_STATE = threading.local()
+
+@contextmanager
+def unit_of_work():
+    """
+    Groups the writes made inside it into a single transaction (one commit, one fsync).
+    Nested uses join the outermost one, so several helpers can be combined into one commit.
+    """
+    depth = getattr(_UNIT_OF_WORK_STATE, "depth", 0)
+    _UNIT_OF_WORK_STATE.depth = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except Exception:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        _UNIT_OF_WORK_STATE.depth = depth
+
 # --- Built-in Tools ---
 class SetAgentStateSchema(BaseModel):
     key: str = Field(..., description="The key of the state variable to set.")
     value: Any = Field(..., description="The value to set for the state variable.")
 
+@tool(SetAgentStateSchema)
 def set_agent_state_tool(key: str, value: Any) -> str:
     """Sets a value in the agent's state."""
     try:
-        state_item = AgentState.query.filter_by(key=key).first()
-        if state_item:
-            state_item.value = value
-        else:
-            state_item = AgentState(key=key, value=value)
-            db.session.add(state_item)
-        db.session.commit()
+        with unit_of_work() as session:
+            state_item = AgentState.query.filter_by(key=key).first()
+            if state_item:
+                state_item.value = value
+            else:
+                state_item = AgentState(key=key, value=value)
+                session.add(state_item)
         return f"State variable '{key}' set successfully."
     except Exception as e:
-        db.session.rollback()
+        if getattr(_UNIT_OF_WORK_STATE, "depth", 0):
+            raise # The enclosing unit of work owns the session and has to roll it back
         return f"Error setting state variable '{key}': {str(e)}"
-set_agent_state_tool.tool_schema = SetAgentStateSchema
 
 class GetAgentStateSchema(BaseModel):
     key: str = Field(..., description="The key of the state variable to retrieve.")
 
+@tool(GetAgentStateSchema)
 def get_agent_state_tool(key: str) -> Any:
     """Retrieves a value from the agent's state."""
     state_item = AgentState.query.filter_by(key=key).first()
@@ -114,7 +183,6 @@ def get_agent_state_tool(key: str) -> Any:
         return state_item.value
     else:
         return f"State variable '{key}' not found."
-get_agent_state_tool.tool_schema = GetAgentStateSchema
 
 # --- RAG Tool ---
 KNOWLEDGE_BASE_PATH = 'knowledge_base' # Defined as per instructions
@@ -123,98 +191,380 @@ class RetrieveFromKnowledgeBaseSchema(BaseModel):
     query: str = Field(..., description="The query to search for in the knowledge base.")
     top_k: int = Field(default=3, description="Number of top results to retrieve.")
 
+KB_EMBEDDING_MODEL = 'mxbai-embed-large'
+KB_EMBEDDING_CACHE_PATH = os.path.join(KNOWLEDGE_BASE_PATH, '.embedding_cache') # shelve: "<model>:<blake2b of chunk>" -> embedding
+KB_EMBEDDING_CONCURRENCY = 16 # Max embedding requests in flight to the Ollama server
+# Persisted index: one contiguous normalized float32 (N, D) matrix, memory-mapped on load, plus row metadata
+KB_INDEX_VECTORS_PATH = os.path.join(KNOWLEDGE_BASE_PATH, '.kb_vecs.npy')
+KB_INDEX_METAS_PATH = os.path.join(KNOWLEDGE_BASE_PATH, '.kb_metas.json')
+# Approximate nearest-neighbour index over the same vectors (faiss only): HNSW on int8 storage, IVF-PQ for large KBs
+KB_ANN_INDEX_PATH = os.path.join(KNOWLEDGE_BASE_PATH, '.kb.faiss')
+KB_ANN_HNSW_M = 32 # Graph neighbours per node
+KB_ANN_EF_SEARCH = 64 # HNSW candidate list size per query; higher trades speed for recall
+KB_ANN_IVFPQ_MIN_CHUNKS = 10_000 # Switch to IVF-PQ (nlist ~ sqrt(N)) from this many chunks
+KB_ANN_NPROBE = 8 # IVF lists scanned per query
+# Held while a worker process loads or builds the index, so gunicorn workers never write the embedding cache
+# (shelve has no locking of its own) or the persisted index at the same time
+KB_INDEX_LOCK_PATH = os.path.join(KNOWLEDGE_BASE_PATH, '.kb.lock')
+KB_INDEX_LOCK_POLL_SECONDS = 0.1
+
+# In-memory index of the knowledge base: normalized (N, D) chunk embeddings plus their chunk metadata.
+# Rebuilt only when a .txt file is added, removed or modified.
+_KB_INDEX = {"signature": None, "embeddings": None, "chunks": [], "ann": None}
+_KB_INDEX_LOCK = threading.Lock()
+
+def _tune_ann_index(index):
+    # Search-time parameters aren't all serialized with the index, so set them after building or loading
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = KB_ANN_EF_SEARCH
+    if hasattr(index, 'nprobe'):
+        index.nprobe = KB_ANN_NPROBE
+    return index
+
+def _build_ann_index(embedding_matrix: Optional[np.ndarray]):
+    """
+    Inner-product ANN index over the normalized embeddings, so a query visits O(log N) vectors instead of all N.
+    HNSW stores vectors as int8 (a quarter of the float32 bytes); from KB_ANN_IVFPQ_MIN_CHUNKS on, IVF-PQ keeps
+    memory and build time bounded. None without faiss.
+    """
+    if faiss is None or embedding_matrix is None:
+        return None
+    vectors = np.ascontiguousarray(embedding_matrix, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if num_vectors >= KB_ANN_IVFPQ_MIN_CHUNKS:
+        nlist = int(np.sqrt(num_vectors))
+        num_subquantizers = next(m for m in (64, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, nlist, num_subquantizers, 8, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, KB_ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    return _tune_ann_index(index)
+
+def _load_ann_index(embedding_matrix: Optional[np.ndarray]):
+    """Reads the persisted ANN index when it covers the same vectors, otherwise rebuilds it."""
+    if faiss is None or embedding_matrix is None:
+        return None
+    if os.path.exists(KB_ANN_INDEX_PATH):
+        try:
+            index = faiss.read_index(KB_ANN_INDEX_PATH)
+            if index.ntotal == embedding_matrix.shape[0]:
+                return _tune_ann_index(index)
+        except RuntimeError as e:
+            print(f"Could not read knowledge base ANN index: {e}")
+    return _build_ann_index(embedding_matrix)
+
+def _knowledge_base_signature() -> tuple:
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns)
+        for entry in os.scandir(KNOWLEDGE_BASE_PATH)
+        if entry.is_file() and entry.name.endswith(".txt")
+    ))
+
+def _load_knowledge_base_chunks(signature: tuple) -> List[Dict[str, Any]]:
+    all_chunks = []
+    for filename, _ in signature: # Assuming knowledge is stored in .txt files
+        filepath = os.path.join(KNOWLEDGE_BASE_PATH, filename)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            # Simple chunking by paragraph, can be improved
+            paragraphs = f.read().split('\n\n')
+        all_chunks.extend(
+            {"text": text, "source": filename, "paragraph": para_idx}
+            for para_idx, para in enumerate(paragraphs) if (text := para.strip())
+        )
+    return all_chunks
+
+def _chunk_cache_key(text: str) -> str:
+    return f"{KB_EMBEDDING_MODEL}:{hashlib.blake2b(text.encode('utf-8')).hexdigest()}"
+
+async def _embed_all(texts: List[str]) -> List[Any]:
+    """Embeds texts concurrently; each result is the embedding response or the exception it raised."""
+    client = ollama.AsyncClient()
+    semaphore = asyncio.Semaphore(KB_EMBEDDING_CONCURRENCY)
+
+    async def embed(text: str):
+        async with semaphore:
+            return await client.embeddings(model=KB_EMBEDDING_MODEL, prompt=text)
+
+    return await asyncio.gather(*[embed(text) for text in texts], return_exceptions=True)
+
+def _build_knowledge_base_index(signature: tuple) -> None:
+    """Loads chunk embeddings from the on-disk cache, embedding only chunks not seen before."""
+    all_chunks = _load_knowledge_base_chunks(signature)
+    keys = [_chunk_cache_key(chunk["text"]) for chunk in all_chunks]
+    indexed_chunks = []
+    embeddings = []
+    with shelve.open(KB_EMBEDDING_CACHE_PATH) as cache:
+        missing = [i for i, key in enumerate(keys) if key not in cache]
+        if missing:
+            responses = asyncio.run(_embed_all([all_chunks[i]["text"] for i in missing]))
+            for i, response in zip(missing, responses):
+                if isinstance(response, Exception):
+                    print(f"Error generating embedding for chunk from {all_chunks[i]['source']}: {response}")
+                    continue
+                cache[keys[i]] = np.asarray(response['embedding'], dtype=np.float32)
+
+        for chunk, key in zip(all_chunks, keys):
+            embedding = cache.get(key)
+            if embedding is not None:
+                indexed_chunks.append(chunk)
+                embeddings.append(embedding)
+
+    embedding_matrix = None
+    if embeddings:
+        embedding_matrix = np.asarray(embeddings, dtype=np.float32)
+        embedding_matrix /= np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+    _KB_INDEX.update(signature=signature, embeddings=embedding_matrix, chunks=indexed_chunks, ann=_build_ann_index(embedding_matrix))
+    print(f"Knowledge base index built: {len(indexed_chunks)} chunks.")
+    if len(indexed_chunks) == len(all_chunks): # Don't persist an index with chunks that failed to embed
+        _save_knowledge_base_index()
+
+@contextmanager
+def _replaced_on_success(path: str):
+    """
+    Yields a temp file path next to `path` that is renamed over it when the block succeeds.
+    The name is unique per call, so concurrent writers never write into or rename each other's temp file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, 0o644) # mkstemp creates 0600; keep the permissions a plain open() gave the index files
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _save_knowledge_base_index() -> None:
+    try:
+        if _KB_INDEX["embeddings"] is not None:
+            with _replaced_on_success(KB_INDEX_VECTORS_PATH) as tmp_path, open(tmp_path, 'wb') as f:
+                np.save(f, _KB_INDEX["embeddings"])
+        if _KB_INDEX["ann"] is not None:
+            with _replaced_on_success(KB_ANN_INDEX_PATH) as tmp_path:
+                faiss.write_index(_KB_INDEX["ann"], tmp_path)
+        elif os.path.exists(KB_ANN_INDEX_PATH):
+            os.remove(KB_ANN_INDEX_PATH) # Stale: built from an older set of vectors
+        # Metadata last: it is what marks the persisted index as matching the current files
+        with _replaced_on_success(KB_INDEX_METAS_PATH) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"model": KB_EMBEDDING_MODEL, "signature": _KB_INDEX["signature"], "chunks": _KB_INDEX["chunks"]}, f)
+    except (OSError, RuntimeError) as e:
+        print(f"Could not persist knowledge base index: {e}")
+
+def _load_knowledge_base_index(signature: tuple) -> bool:
+    """Memory-maps the persisted index if it matches the current files; the OS page cache keeps it warm."""
+    try:
+        with open(KB_INDEX_METAS_PATH, 'r', encoding='utf-8') as f:
+            metas = json.load(f)
+        if metas["model"] != KB_EMBEDDING_MODEL or tuple(map(tuple, metas["signature"])) != signature:
+            return False
+        embedding_matrix = np.load(KB_INDEX_VECTORS_PATH, mmap_mode='r') if metas["chunks"] else None
+    except (OSError, ValueError, KeyError):
+        return False
+    if embedding_matrix is not None and embedding_matrix.shape[0] != len(metas["chunks"]):
+        return False
+    _KB_INDEX.update(signature=signature, embeddings=embedding_matrix, chunks=metas["chunks"], ann=_load_ann_index(embedding_matrix))
+    print(f"Knowledge base index loaded: {len(metas['chunks'])} chunks.")
+    return True
+
+@contextmanager
+def _knowledge_base_file_lock():
+    """Exclusive lock across worker processes on KB_INDEX_LOCK_PATH; released when the file is closed."""
+    with open(KB_INDEX_LOCK_PATH, 'a') as lock_file:
+        # Polled rather than blocking: under gevent workers a blocking flock would stall every request in the worker
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(KB_INDEX_LOCK_POLL_SECONDS)
+        yield
+
+def get_knowledge_base_index() -> Dict[str, Any]:
+    signature = _knowledge_base_signature()
+    with _KB_INDEX_LOCK:
+        if _KB_INDEX["signature"] != signature:
+            # A worker that waited for another one's build loads the index that worker just persisted
+            with _knowledge_base_file_lock():
+                if not _load_knowledge_base_index(signature):
+                    _build_knowledge_base_index(signature)
+        return dict(_KB_INDEX)
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first: an O(N) partition, then a sort of only those k."""
+    k = max(1, min(k, len(scores)))
+    top_indices = np.argpartition(-scores, k - 1)[:k]
+    return top_indices[np.argsort(-scores[top_indices])]
+
+@tool(RetrieveFromKnowledgeBaseSchema)
 def retrieve_from_knowledge_base(query: str, top_k: int = 3) -> List[str]:
     """
     Retrieves relevant chunks from the knowledge base using Ollama embeddings.
+    Chunk embeddings come from a cached index, so only the query is embedded per call.
     """
     if not os.path.exists(KNOWLEDGE_BASE_PATH):
         return ["Knowledge base directory not found."]
 
-    all_chunks = []
-    for filename in os.listdir(KNOWLEDGE_BASE_PATH):
-        if filename.endswith(".txt"): # Assuming knowledge is stored in .txt files
-            filepath = os.path.join(KNOWLEDGE_BASE_PATH, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # Simple chunking by paragraph, can be improved
-                paragraphs = content.split('\n\n')
-                for para_idx, para in enumerate(paragraphs):
-                    if para.strip():
-                         all_chunks.append({"text": para.strip(), "source": filename, "paragraph": para_idx})
-
-    if not all_chunks:
+    kb_index = get_knowledge_base_index()
+    if not kb_index["chunks"]:
+        if kb_index["signature"]:
+            return ["Could not generate embeddings for knowledge base content."]
         return ["No content found in the knowledge base."]
 
-    # Generate embeddings for all chunks
-    chunk_embeddings = []
-    for chunk in all_chunks:
-        try:
-            response = ollama.embeddings(model='mxbai-embed-large', prompt=chunk["text"])
-            chunk_embeddings.append({"chunk": chunk, "embedding": response['embedding']})
-        except Exception as e:
-            print(f"Error generating embedding for chunk from {chunk['source']}: {e}")
-            continue
-
-    if not chunk_embeddings:
-        return ["Could not generate embeddings for knowledge base content."]
-
     # Generate embedding for the query
     try:
-        query_embedding_response = ollama.embeddings(model='mxbai-embed-large', prompt=query)
+        query_embedding_response = OLLAMA_CLIENT.embeddings(model=KB_EMBEDDING_MODEL, prompt=query)
         query_embedding = query_embedding_response['embedding']
     except Exception as e:
         return [f"Error generating embedding for query: {str(e)}"]
 
-    # Calculate similarity (cosine similarity)
-    # Note: ollama client doesn't provide a direct similarity function.
-    # This requires numpy or similar for efficient dot product. For simplicity,
-    # we'll skip the actual math here and return a placeholder.
-    # In a real scenario, you'd use numpy:
-    # import numpy as np
-    # similarities = [np.dot(ce["embedding"], query_embedding) / (np.linalg.norm(ce["embedding"]) * np.linalg.norm(query_embedding)) for ce in chunk_embeddings]
-    # For now, just returning the first few chunks as a mock retrieval
-
-    # Mocking similarity scoring and ranking for now
-    # Replace with actual cosine similarity calculation if numpy is available
-    # For demonstration, we'll just return the text of the first few chunks
-
-    # Simulate relevance scoring (replace with actual cosine similarity if numpy is added)
-    # This is a simplified example. Real RAG needs proper similarity calculation.
-    # We will return chunks that contain words from the query for this example.
-
-    relevant_chunks = []
-    query_words = set(query.lower().split())
-    for ce in chunk_embeddings:
-        chunk_text_lower = ce["chunk"]["text"].lower()
-        # Basic keyword matching for demonstration
-        if any(word in chunk_text_lower for word in query_words):
-            relevant_chunks.append(ce["chunk"])
-            if len(relevant_chunks) >= top_k:
-                break
+    # Cosine similarity over normalized embeddings: ANN search when faiss is available, else one exact matrix-vector product
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector /= np.sqrt(np.vdot(query_vector, query_vector))
+    if kb_index["ann"] is not None:
+        _, top_indices = kb_index["ann"].search(query_vector[np.newaxis, :], max(1, min(top_k, len(kb_index["chunks"]))))
+        top_indices = top_indices[0][top_indices[0] >= 0] # -1 pads results when fewer than k neighbours are found
+    else:
+        scores = kb_index["embeddings"] @ query_vector
+        top_indices = top_k_indices(scores, top_k)
+
+    relevant_chunks = [kb_index["chunks"][i] for i in top_indices]
+
+    return [f"Source: {chunk['source']}, Paragraph {chunk['paragraph']}: {chunk['text']}" for chunk in relevant_chunks]
+
+# The tool set is fixed once the module is loaded, so discover it once rather than per request
+AVAILABLE_TOOL_DEFS = discover_tools(sys.modules[__name__])
+TOOL_FUNCTIONS = {
+    name: func for name, func in inspect.getmembers(sys.modules[__name__], inspect.isfunction)
+    if hasattr(func, 'tool_schema')
+}
+
 
-    if not relevant_chunks:
-        return ["No relevant information found for your query."]
+# --- Semantic Response Cache ---
+RESPONSE_CACHE_THRESHOLD = 0.92 # Minimum cosine similarity for a cache hit
+RESPONSE_CACHE_TTL = 3600 # Seconds a cached response stays valid
+RESPONSE_CACHE_MAX_ENTRIES = 256 # Per scope; expired and oldest entries are pruned whenever one is stored
+RESPONSE_CACHE_HISTORY_TURNS = 4 # Prior turns embedded along with the user message
+RESPONSE_CACHE_EMBEDDING_MEMO = 256 # Recent prompt texts whose embeddings are kept in memory
+# Prompt embeddings are computed here while chat_endpoint loads the agent profile
+_PROMPT_EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prompt-embed")
 
-    return [f"Source: {chunk['source']}, Paragraph {chunk['paragraph']}: {chunk['text']}" for chunk in relevant_chunks[:top_k]]
+# scope -> {"embeddings": (N, D) float32, "responses": [...], "created": (N,) epoch seconds}, loaded from the DB on first use
+_RESPONSE_CACHE = {}
+_RESPONSE_CACHE_LOCK = threading.Lock()
 
-retrieve_from_knowledge_base.tool_schema = RetrieveFromKnowledgeBaseSchema
+def response_cache_scope(model: str, persona: str) -> str:
+    return f"{model}:{hashlib.blake2b(persona.encode('utf-8'), digest_size=16).hexdigest()}"
+
+def embed_chat_prompt(conversation: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """
+    Normalized embedding of the recent turns and user message, or None if Ollama is unavailable.
+    `conversation` has no system message: the persona is part of the cache scope, and would dominate the embedding.
+    """
+    key_messages = conversation[-(RESPONSE_CACHE_HISTORY_TURNS + 1):]
+    prompt_text = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in key_messages)
+    try:
+        return _embed_prompt_text(prompt_text)
+    except Exception as e:
+        print(f"Could not embed chat prompt for the response cache: {e}")
+        return None
+
+@functools.lru_cache(maxsize=RESPONSE_CACHE_EMBEDDING_MEMO)
+def _embed_prompt_text(prompt_text: str) -> np.ndarray:
+    """
+    Exact repeats of a prompt skip the Ollama embeddings call, which is most of the cost of a cache hit.
+    Failures raise, so they are not memoized. The result is shared between callers and read-only.
+    """
+    response = OLLAMA_CLIENT.embeddings(model=KB_EMBEDDING_MODEL, prompt=prompt_text)
+    vector = np.asarray(response['embedding'], dtype=np.float32)
+    vector = vector / np.sqrt(np.vdot(vector, vector))
+    vector.setflags(write=False)
+    return vector
+
+def _response_cache_entry(scope: str) -> Dict[str, Any]:
+    entry = _RESPONSE_CACHE.get(scope)
+    if entry is None:
+        rows = (
+            ResponseCacheEntry.query.filter_by(scope=scope)
+            .order_by(ResponseCacheEntry.id.desc()).limit(RESPONSE_CACHE_MAX_ENTRIES).all()
+        )[::-1]
+        entry = {
+            "ids": np.asarray([row.id for row in rows], dtype=np.int64),
+            "embeddings": np.asarray([np.frombuffer(row.embedding, dtype=np.float32) for row in rows], dtype=np.float32),
+            "responses": [row.response for row in rows],
+            "created": np.asarray([row.created_at.replace(tzinfo=timezone.utc).timestamp() for row in rows]),
+        }
+        _RESPONSE_CACHE[scope] = entry
+    return entry
+
+def lookup_cached_response(scope: str, prompt_embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+    with _RESPONSE_CACHE_LOCK:
+        entry = _response_cache_entry(scope)
+        if not entry["responses"]:
+            return None
+        scores = entry["embeddings"] @ prompt_embedding
+        scores[entry["created"] < time.time() - RESPONSE_CACHE_TTL] = -1.0 # Expired
+        best = int(np.argmax(scores))
+        if scores[best] < RESPONSE_CACHE_THRESHOLD:
+            return None
+        print(f"Response cache hit in scope {scope} (similarity {scores[best]:.3f})")
+        return entry["responses"][best]
+
+def store_cached_response(scope: str, prompt_embedding: np.ndarray, response: Dict[str, Any]) -> None:
+    with _RESPONSE_CACHE_LOCK:
+        entry = _response_cache_entry(scope)
+        now = time.time()
+        cutoff = now - RESPONSE_CACHE_TTL
+        # Unexpired entries to keep alongside the new one, newest last
+        keep = np.flatnonzero(entry["created"] >= cutoff)[-(RESPONSE_CACHE_MAX_ENTRIES - 1):]
+        with unit_of_work() as session:
+            row = ResponseCacheEntry(scope=scope, embedding=prompt_embedding.tobytes(), response=response)
+            session.add(row)
+            session.flush() # Assigns row.id
+            row_id = row.id
+            oldest_kept_id = int(entry["ids"][keep[0]]) if len(keep) else row_id
+            session.execute(
+                ResponseCacheEntry.__table__.delete()
+                .where(ResponseCacheEntry.scope == scope)
+                .where((ResponseCacheEntry.id < oldest_kept_id) | (ResponseCacheEntry.created_at < datetime.fromtimestamp(cutoff, timezone.utc)))
+            )
+        entry["ids"] = np.append(entry["ids"][keep], row_id)
+        entry["embeddings"] = np.vstack([entry["embeddings"][keep].reshape(-1, prompt_embedding.shape[0]), prompt_embedding])
+        entry["responses"] = [entry["responses"][i] for i in keep] + [response]
+        entry["created"] = np.append(entry["created"][keep], now)
 
 
 # --- Background Task Management ---
+BACKGROUND_TASK_WORKERS = 8
+_TASK_EXECUTOR = ThreadPoolExecutor(max_workers=BACKGROUND_TASK_WORKERS, thread_name_prefix="background-task")
+_TASK_FUTURES = {} # task_id -> Future, while the task is queued or running
+
+def _run_with_app_context(app: Flask, target, *args):
+    with app.app_context():
+        return target(*args)
+
+def submit_background_task(task_id: int, target, *args):
+    """Runs target(*args) on the shared, bounded task executor and tracks it until it finishes."""
+    future = _TASK_EXECUTOR.submit(_run_with_app_context, current_app._get_current_object(), target, *args)
+    _TASK_FUTURES[task_id] = future
+    future.add_done_callback(lambda _: _TASK_FUTURES.pop(task_id, None))
+    return future
+
 def create_background_task(name: str, agent_profile_id: Optional[int] = None) -> BackgroundTask:
     new_task = BackgroundTask(name=name, agent_profile_id=agent_profile_id)
-    db.session.add(new_task)
-    db.session.commit()
+    with unit_of_work() as session:
+        session.add(new_task)
+        session.flush() # Assigns new_task.id even when joined to an enclosing unit of work
     return new_task
 
 def update_background_task(task_id: int, status: str, result: Optional[str] = None):
-    task = BackgroundTask.query.get(task_id)
-    if task:
-        task.status = status
-        if result is not None:
-            task.result = result
-        task.updated_at = func.now()
-        db.session.commit()
+    with unit_of_work():
+        task = db.session.get(BackgroundTask, task_id)
+        if task:
+            task.status = status
+            if result is not None:
+                task.result = result
+            task.updated_at = func.now()
 
 def simulate_long_running_process(task_id: int, duration: int):
     update_background_task(task_id, status="in_progress")
@@ -226,6 +576,12 @@ def simulate_long_running_process(task_id: int, duration: int):
 
 
 # --- Core Ollama Call Function ---
+OLLAMA_KEEP_ALIVE = -1 # Keep the model (and its KV cache) loaded between requests
+OLLAMA_TIMEOUT = float(os.environ.get("PSI_OLLAMA_TIMEOUT", 180)) # Seconds without a byte from Ollama before a call fails
+# One shared client (its httpx pool keeps connections alive). Under the gevent worker a waiting call only
+# parks its greenlet; the timeout keeps a hung Ollama from holding requests open indefinitely.
+OLLAMA_CLIENT = ollama.Client(timeout=OLLAMA_TIMEOUT)
+
 def call_ollama(model: str, messages: List[Dict[str, Any]], stream: bool = False, tools: Optional[List[Dict[str, Any]]] = None) -> Union[Dict[str, Any], Any]:
     """
     Calls the Ollama API with the given model, messages, and optional tools.
@@ -238,19 +594,21 @@ def call_ollama(model: str, messages: List[Dict[str, Any]], stream: bool = False
     }
     try:
         if tools:
-            response = ollama.chat(
+            response = OLLAMA_CLIENT.chat(
                 model=model,
                 messages=messages,
                 tools=tools,
                 stream=stream,
-                options=options
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
         else:
-            response = ollama.chat(
+            response = OLLAMA_CLIENT.chat(
                 model=model,
                 messages=messages,
                 stream=stream,
-                options=options
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
         return response
     except Exception as e:
@@ -261,9 +619,9 @@ def call_ollama(model: str, messages: List[Dict[str, Any]], stream: bool = False
             print(f"Model {model} not found, trying with llama3...")
             try:
                 if tools:
-                    response = ollama.chat(model='llama3', messages=messages, tools=tools, stream=stream, options=options)
+                    response = OLLAMA_CLIENT.chat(model='llama3', messages=messages, tools=tools, stream=stream, options=options, keep_alive=OLLAMA_KEEP_ALIVE)
                 else:
-                    response = ollama.chat(model='llama3', messages=messages, stream=stream, options=options)
+                    response = OLLAMA_CLIENT.chat(model='llama3', messages=messages, stream=stream, options=options, keep_alive=OLLAMA_KEEP_ALIVE)
                 return response
             except Exception as e2:
                 print(f"Error calling Ollama with fallback model llama3: {e2}")
@@ -272,48 +630,224 @@ def call_ollama(model: str, messages: List[Dict[str, Any]], stream: bool = False
         return {"error": str(e), "message": "Failed to call Ollama."}
 
 
+# --- Prompt Prefix ---
+@functools.lru_cache(maxsize=8)
+def system_message_for(persona: str) -> Dict[str, str]:
+    """
+    The system message for a persona, normalized once. Every request with the same persona then
+    sends a byte-identical prefix, which lets Ollama reuse its KV cache instead of re-running prefill.
+    Nothing request-specific (timestamps, ids) may be added to it.
+    """
+    return {"role": "system", "content": persona.strip()}
+
+# --- Tool Execution ---
+MAX_TOOL_ITERATIONS = 5
+
+def execute_tool_calls(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Runs the tool calls requested by the model and returns one result entry per call.
+    The tools' writes (e.g. several set_agent_state calls) share one transaction and one commit;
+    each call runs in its own savepoint, so a failing tool only undoes its own writes.
+    """
+    tool_results = []
+    try:
+        with unit_of_work() as session:
+            _begin_sqlite_transaction(session)
+            _run_tool_calls(tool_calls, tool_results)
+    except Exception as e:
+        # The batch was rolled back, so none of this round's writes took effect
+        print(f"Error committing tool results: {e}")
+        for tool_result in tool_results:
+            tool_result["output"] = f"Error: Changes made by tool {tool_result['tool_name']} could not be saved: {str(e)}"
+    return tool_results
+
+def _begin_sqlite_transaction(session) -> None:
+    # pysqlite only issues BEGIN before DML, so the first SAVEPOINT would open the transaction and its
+    # RELEASE would commit it; open it explicitly so the per-tool savepoints nest inside one transaction
+    if db.engine.dialect.name != "sqlite":
+        return
+    dbapi_connection = session.connection().connection.dbapi_connection
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute("BEGIN")
+
+def _run_tool_calls(tool_calls: List[Dict[str, Any]], tool_results: List[Dict[str, Any]]) -> None:
+    for tool_call in tool_calls:
+        tool_name = tool_call['function']['name']
+        tool_args_str = tool_call['function']['arguments']
+        tool_call_id = tool_call.get('id') # Ollama doesn't assign ids; OpenAI-style calls do
+
+        print(f"Tool call: {tool_name}, Args_str: {tool_args_str}")
+
+        try:
+            # Ollama already decodes the arguments into a dict; OpenAI-style calls send a JSON string
+            tool_args = tool_args_str if isinstance(tool_args_str, dict) else orjson.loads(tool_args_str)
+        except orjson.JSONDecodeError as e:
+            print(f"Error decoding JSON arguments for tool {tool_name}: {e}")
+            print(f"Problematic string: {tool_args_str}")
+            tool_results.append({
+                "tool_call_id": tool_call_id,
+                "tool_name": tool_name,
+                "output": f"Error: Invalid JSON arguments provided: {tool_args_str}"
+            })
+            continue # Skip to next tool call
+
+        # Dynamically call the tool function
+        tool_function = TOOL_FUNCTIONS.get(tool_name)
+        if tool_function:
+            try:
+                print(f"Executing tool: {tool_name} with args: {tool_args}")
+                # Ensure all required arguments are present
+                missing_args = tool_function.required_args - tool_args.keys()
+                if missing_args:
+                     result = f"Error: Missing required arguments for tool {tool_name}: {', '.join(sorted(missing_args))}"
+                else:
+                    with db.session.begin_nested():
+                        result = tool_function(**tool_args)
+                        db.session.flush() # Surface this tool's write errors here, not at the batch commit
+
+                # If the result is not a string, convert it (e.g., for get_agent_state_tool)
+                if not isinstance(result, str):
+                    result = orjson.dumps(result).decode()
+
+            except Exception as e:
+                result = f"Error executing tool {tool_name}: {str(e)}"
+            print(f"Tool {tool_name} result: {result}")
+        else:
+            result = f"Error: Tool '{tool_name}' not found or not callable."
+
+        tool_results.append({
+            "tool_call_id": tool_call_id,
+            "tool_name": tool_name,
+            "output": result
+        })
+
+def tool_result_messages(tool_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One "tool" message per call, so each output reaches the model as-is instead of re-encoded inside a JSON list."""
+    return [
+        {"role": "tool", "tool_call_id": result["tool_call_id"], "tool_name": result["tool_name"], "content": result["output"]}
+        for result in tool_results
+    ]
+
+def _sse_event(payload: Dict[str, Any]) -> str:
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+def stream_chat_events(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], cache_scope: str, prompt_embedding: Optional[np.ndarray]):
+    """
+    Runs the tool loop with streamed Ollama calls and yields Server-Sent Events: a "token" event
+    for each content chunk as it is generated, then a final "done" (or "error") event.
+    """
+    used_tools = False
+    for iteration in range(MAX_TOOL_ITERATIONS):
+        print(f"Iteration {iteration + 1} (streaming): Sending messages to Ollama: {messages}")
+        stream = call_ollama(model=model, messages=messages, stream=True, tools=tools)
+        if isinstance(stream, dict): # call_ollama reports failures as an error dict
+            yield _sse_event(stream)
+            return
+
+        content_parts = []
+        tool_calls = []
+        try:
+            for chunk in stream:
+                chunk_message = chunk['message']
+                if chunk_message.get('tool_calls'):
+                    tool_calls.extend(chunk_message['tool_calls'])
+                if chunk_message.get('content'):
+                    content_parts.append(chunk_message['content'])
+                    yield _sse_event({"token": chunk_message['content']})
+        except Exception as e:
+            print(f"Error streaming from Ollama: {e}")
+            yield _sse_event({"error": str(e), "message": "Failed to call Ollama."})
+            return
+
+        ai_message = {"role": "assistant", "content": "".join(content_parts)}
+        if not tool_calls: # Final answer for this turn
+            if prompt_embedding is not None and not used_tools:
+                store_cached_response(cache_scope, prompt_embedding, ai_message)
+            yield _sse_event({"done": True, **ai_message})
+            return
+
+        # Tool arguments only arrive complete, so tools run once the call has finished streaming
+        used_tools = True
+        messages.append({**ai_message, "tool_calls": tool_calls})
+        messages.extend(tool_result_messages(execute_tool_calls(tool_calls)))
+
+    yield _sse_event({"done": True, "role": "assistant", "content": "Max tool iterations reached. Please try again or rephrase your request."})
+
+def cached_chat_events(cached_response: Dict[str, Any]):
+    """Replays a cached reply as the events a streamed answer ends with: one "token" event, then "done"."""
+    if cached_response.get('content'):
+        yield _sse_event({"token": cached_response['content']})
+    yield _sse_event({"done": True, **cached_response})
+
+
 # --- API Routes ---
-@app.route('/')
+@api.route('/')
 def serve_frontend():
     return send_from_directory('../frontend/static', 'index.html')
 
-@app.route('/<path:path>')
+@api.route('/<path:path>')
 def serve_static_files(path):
     return send_from_directory('../frontend/static', path)
 
-@app.route('/api/chat', methods=['POST'])
+@api.route('/api/chat', methods=['POST'])
 def chat_endpoint():
     data = request.json
     user_message_content = data.get('message')
     chat_history: List[Dict[str, Any]] = data.get('history', [])
     selected_model = data.get('model', 'llama3') # Default to llama3 if not specified
 
+    conversation = [*chat_history, {"role": "user", "content": user_message_content}]
+    # The cache embedding doesn't depend on the persona, so the Ollama call overlaps the profile query
+    embedding_future = _PROMPT_EMBED_EXECUTOR.submit(embed_chat_prompt, conversation)
+
     # Get current agent profile (assuming one for now)
     agent_profile = AgentProfile.query.first()
     if not agent_profile:
         return jsonify({"error": "Agent profile not found. Please initialize."}), 500
 
     # Construct messages for Ollama
-    messages = [{"role": "system", "content": agent_profile.persona}]
-    messages.extend(chat_history)
-    messages.append({"role": "user", "content": user_message_content})
+    messages = [system_message_for(agent_profile.persona), *conversation]
 
     # Discover available tools
     # Tool functions should be defined globally or in an imported module
-    available_tools_definitions = discover_tools(globals()) # Pass current module
+    available_tools_definitions = AVAILABLE_TOOL_DEFS # Discovered once at import
     # Or, if tools are in a specific class/object:
     # from agent_tools import MyAgentTools
     # available_tools_definitions = discover_tools(MyAgentTools)
 
+    # Serve near-duplicates of recent requests from the semantic response cache
+    cache_scope = response_cache_scope(selected_model, agent_profile.persona)
+    prompt_embedding = embedding_future.result()
+    if prompt_embedding is not None:
+        cached_response = lookup_cached_response(cache_scope, prompt_embedding)
+        if cached_response is not None:
+            if data.get('stream'): # The client is reading an event stream, so the hit has to arrive as one too
+                return Response(cached_chat_events(cached_response), mimetype='text/event-stream')
+            return jsonify(cached_response)
+
+    if data.get('stream'):
+        # Send tokens to the client as they are generated instead of after the whole reply
+        return Response(
+            stream_with_context(stream_chat_events(selected_model, messages, available_tools_definitions, cache_scope, prompt_embedding)),
+            mimetype='text/event-stream'
+        )
+
+    def final_response(ai_message, used_tools):
+        # Answers that relied on tool calls may depend on live state, so only plain answers are cached
+        response_message = {"role": ai_message['role'], "content": ai_message['content']}
+        if prompt_embedding is not None and not used_tools:
+            store_cached_response(cache_scope, prompt_embedding, response_message)
+        return jsonify(response_message)
+
     # --- Advanced Orchestrator Logic ---
-    MAX_TOOL_ITERATIONS = 5
+    used_tools = False
     for _ in range(MAX_TOOL_ITERATIONS):
         print(f"Iteration {_ + 1}: Sending messages to Ollama: {messages}")
         if not available_tools_definitions: # If no tools, simple chat
              print("No tools defined for the agent. Proceeding with simple chat.")
              response = call_ollama(model=selected_model, messages=messages)
              if response and response.get('message'):
-                return jsonify(response['message'])
+                return final_response(response['message'], used_tools)
              else:
                 return jsonify({"error": "Failed to get response from Ollama", "details": response}), 500
 
@@ -330,69 +864,21 @@ def chat_endpoint():
         messages.append(ai_message) # Add AI's response to history
 
         if ai_message.get('tool_calls'):
-            tool_calls = ai_message['tool_calls']
-            tool_results = []
-
-            for tool_call in tool_calls:
-                tool_name = tool_call['function']['name']
-                tool_args_str = tool_call['function']['arguments']
-
-                print(f"Tool call: {tool_name}, Args_str: {tool_args_str}")
-
-                try:
-                    tool_args = json.loads(tool_args_str)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON arguments for tool {tool_name}: {e}")
-                    print(f"Problematic string: {tool_args_str}")
-                    tool_results.append({
-                        "tool_call_id": tool_call['id'],
-                        "output": f"Error: Invalid JSON arguments provided: {tool_args_str}"
-                    })
-                    continue # Skip to next tool call
-
-                # Dynamically call the tool function
-                tool_function = globals().get(tool_name)
-                if tool_function and callable(tool_function):
-                    try:
-                        print(f"Executing tool: {tool_name} with args: {tool_args}")
-                        # Ensure all required arguments are present
-                        sig = inspect.signature(tool_function)
-                        missing_args = [p for p in sig.parameters if p not in tool_args and sig.parameters[p].default == inspect.Parameter.empty]
-                        if missing_args:
-                             result = f"Error: Missing required arguments for tool {tool_name}: {', '.join(missing_args)}"
-                        else:
-                            result = tool_function(**tool_args)
-
-                        # If the result is not a string, convert it (e.g., for get_agent_state_tool)
-                        if not isinstance(result, str):
-                            result = json.dumps(result)
-
-                    except Exception as e:
-                        result = f"Error executing tool {tool_name}: {str(e)}"
-                    print(f"Tool {tool_name} result: {result}")
-                else:
-                    result = f"Error: Tool '{tool_name}' not found or not callable."
-
-                tool_results.append({
-                    "tool_call_id": tool_call['id'],
-                    "output": result
-                })
+            used_tools = True
+            tool_results = execute_tool_calls(ai_message['tool_calls'])
 
             # Add tool results to messages for the next iteration
-            messages.append({
-                "role": "tool",
-                "content": json.dumps(tool_results) # Ensure content is a JSON string
-            })
+            messages.extend(tool_result_messages(tool_results))
             # Continue to the next iteration of the loop to let the LLM process tool results
 
         else: # No tool calls, AI response is final for this turn
-            return jsonify(ai_message)
+            return final_response(ai_message, used_tools)
 
     # If loop finishes, it means max iterations were hit
     return jsonify({"role": "assistant", "content": "Max tool iterations reached. Please try again or rephrase your request."})
 
 
-@app.route('/api/agent/profile', methods=['GET', 'POST'])
+@api.route('/api/agent/profile', methods=['GET', 'POST'])
 def agent_profile_route():
     if request.method == 'GET':
         profile = AgentProfile.query.first()
@@ -407,32 +893,41 @@ def agent_profile_route():
 
     if request.method == 'POST':
         data = request.json
-        profile = AgentProfile.query.first()
-        if not profile:
-            profile = AgentProfile()
-            db.session.add(profile)
-
-        profile.name = data.get('name', profile.name)
-        profile.persona = data.get('persona', profile.persona)
-        profile.tools = data.get('tools', profile.tools) # Expecting list of tool definitions
-        profile.state = data.get('state', profile.state) # Update agent state
-        profile.updated_at = func.now()
-        db.session.commit()
+        with unit_of_work() as session:
+            profile = AgentProfile.query.first()
+            if not profile:
+                profile = AgentProfile()
+                session.add(profile)
+
+            profile.name = data.get('name', profile.name)
+            profile.persona = data.get('persona', profile.persona)
+            profile.tools = data.get('tools', profile.tools) # Expecting list of tool definitions
+            profile.state = data.get('state', profile.state) # Update agent state
+            profile.updated_at = func.now()
         return jsonify({"message": "Profile updated successfully"})
 
 # New API endpoint for background tasks
-@app.route('/api/tasks', methods=['GET', 'POST'])
+@api.route('/api/tasks', methods=['GET', 'POST'])
 def manage_tasks():
     if request.method == 'GET':
-        tasks = BackgroundTask.query.all()
-        return jsonify([{
+        # Newest first, one page at a time; ?status=in_progress narrows polling to the matching subset
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        status = request.args.get('status')
+        query = BackgroundTask.query
+        if status:
+            query = query.filter_by(status=status).order_by(BackgroundTask.updated_at.desc(), BackgroundTask.id.desc())
+        else:
+            query = query.order_by(BackgroundTask.id.desc())
+        tasks = query.limit(limit).offset(offset).all()
+        return Response(orjson.dumps([{
             "id": task.id,
             "name": task.name,
             "status": task.status,
             "result": task.result,
             "created_at": task.created_at.isoformat() if task.created_at else None,
             "updated_at": task.updated_at.isoformat() if task.updated_at else None
-        } for task in tasks])
+        } for task in tasks]), mimetype='application/json')
 
     if request.method == 'POST':
         data = request.json
@@ -442,62 +937,101 @@ def manage_tasks():
         # Example: Create a task and run it in a background thread
         new_task = create_background_task(name=task_name)
 
-        # Start the simulation in a new thread
-        thread = threading.Thread(target=simulate_long_running_process, args=(new_task.id, duration))
-        thread.start()
+        # Queue the simulation on the shared executor (at most BACKGROUND_TASK_WORKERS run at once)
+        submit_background_task(new_task.id, simulate_long_running_process, new_task.id, duration)
 
         return jsonify({"message": "Task created and started", "task_id": new_task.id}), 201
 
-@app.route('/api/tasks/<int:task_id>', methods=['GET'])
+@api.route('/api/tasks/<int:task_id>', methods=['GET'])
 def get_task_status(task_id):
-    task = BackgroundTask.query.get(task_id)
+    task = db.session.get(BackgroundTask, task_id)
     if task:
+        future = _TASK_FUTURES.get(task_id)
         return jsonify({
             "id": task.id,
             "name": task.name,
             "status": task.status,
             "result": task.result,
+            "running": bool(future and future.running()), # Live executor state, may be ahead of status
             "created_at": task.created_at.isoformat() if task.created_at else None,
             "updated_at": task.updated_at.isoformat() if task.updated_at else None
         })
     return jsonify({"message": "Task not found"}), 404
 
 # New API endpoint for general config (e.g., available models)
-@app.route('/api/config', methods=['GET'])
+# Installed models rarely change, so /api/config serves a cached listing instead of asking Ollama on every GET
+MODELS_CACHE_TTL = 30 # seconds
+_models_cache = {"ts": 0.0, "value": []}
+_models_cache_lock = threading.Lock()
+
+def _cached_models(ttl: float = MODELS_CACHE_TTL) -> List[str]:
+    """Names of the locally installed Ollama models, refreshed at most once per `ttl` seconds. Raises if Ollama is unreachable."""
+    with _models_cache_lock:
+        now = time.monotonic()
+        if now - _models_cache["ts"] > ttl:
+            _models_cache["value"] = [model['model'] for model in OLLAMA_CLIENT.list()['models']]
+            _models_cache["ts"] = now
+        return _models_cache["value"]
+
+def _warm_models_cache():
+    try:
+        _cached_models()
+    except Exception as e:
+        print(f"Could not prefetch Ollama models: {e}")
+
+@api.route('/api/config', methods=['GET'])
 def get_config():
     try:
         # Fetch available local models from Ollama
-        ollama_models = ollama.list()
-        local_model_names = [model['name'] for model in ollama_models.get('models', [])]
+        local_model_names = _cached_models()
     except Exception as e:
         print(f"Could not connect to Ollama to fetch models: {e}")
         local_model_names = ["llama3 (default, if Ollama offline)"] # Fallback
 
     return jsonify({
         "available_models": local_model_names,
-        "knowledge_base_path": app.config['KNOWLEDGE_BASE_PATH'],
-        "upload_folder": app.config['UPLOAD_FOLDER']
+        "knowledge_base_path": current_app.config['KNOWLEDGE_BASE_PATH'],
+        "upload_folder": current_app.config['UPLOAD_FOLDER']
     })
 
 
 # --- Initialization ---
-def init_db(app_context):
-    with app_context:
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;" # Readers (task polling) no longer block on writers
+    "PRAGMA synchronous=NORMAL;" # With WAL, fsync at checkpoints instead of on every commit
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=268435456;" # 256 MB
+    "PRAGMA cache_size=-65536;" # 64 MB page cache
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.executescript(SQLITE_PRAGMAS)
+    cursor.close()
+
+def init_db(app: Flask):
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite" and not event.contains(db.engine, "connect", _set_sqlite_pragmas):
+            event.listen(db.engine, "connect", _set_sqlite_pragmas)
+            db.engine.dispose() # Connections opened before this point would miss the PRAGMAs
         db.create_all()
-        # Create default agent profile if it doesn't exist
-        if not AgentProfile.query.first():
-            default_tools = discover_tools(globals()) # Discover all tools in current scope
-            # Filter out tools that are not meant for the agent directly if necessary
-            # For now, add all discovered tools
-            profile = AgentProfile(
-                name="Monarch Agent",
-                persona="You are Monarch, a helpful AI assistant specializing in software development and task automation. You have access to a variety of tools to help users. Be concise and proactive.",
-                tools=default_tools, # Store discovered tools
-                state={"greeting_enabled": True} # Example initial state
-            )
-            db.session.add(profile)
-            db.session.commit()
-            print("Default agent profile created.")
+        # Create default agent profile if it doesn't exist (check and insert in one transaction)
+        with unit_of_work() as session:
+            if not AgentProfile.query.first():
+                default_tools = AVAILABLE_TOOL_DEFS # All tools discovered in this module
+                # Filter out tools that are not meant for the agent directly if necessary
+                # For now, add all discovered tools
+                profile = AgentProfile(
+                    name="Monarch Agent",
+                    persona="You are Monarch, a helpful AI assistant specializing in software development and task automation. You have access to a variety of tools to help users. Be concise and proactive.",
+                    tools=default_tools, # Store discovered tools
+                    state={"greeting_enabled": True} # Example initial state
+                )
+                session.add(profile)
+                print("Default agent profile created.")
+
+        # Fetch the model list off the request path so the first /api/config is served from cache
+        threading.Thread(target=_warm_models_cache, daemon=True).start()
 
         # Ensure knowledge base and upload directories exist
         if not os.path.exists(app.config['KNOWLEDGE_BASE_PATH']):
@@ -507,6 +1041,38 @@ def init_db(app_context):
             os.makedirs(app.config['UPLOAD_FOLDER'])
             print(f"Created upload folder: {app.config['UPLOAD_FOLDER']}")
 
+# The sync engine stays (gevent yields around Ollama calls), but SQLAlchemy's default pool (5 + 10 overflow)
+# starves once a gevent worker holds more chat requests than that; size it for worker_connections instead
+DB_POOL_SIZE = int(os.environ.get("PSI_DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("PSI_DB_MAX_OVERFLOW", 30))
+DB_POOL_TIMEOUT = float(os.environ.get("PSI_DB_POOL_TIMEOUT", 10))
+
+def _engine_options(uri: str) -> Dict[str, Any]:
+    """Connection pool settings for the configured database; in-memory SQLite keeps Flask-SQLAlchemy's single-connection pool."""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if url.get_backend_name() != "sqlite":
+        options["pool_pre_ping"] = True # Drop connections the database server closed while idle
+    return options
+
+# --- Application Factory ---
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """Builds the configured Flask app: JSON provider, database, API routes, and an initialized schema."""
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    db.init_app(app)
+    app.register_blueprint(api)
+    init_db(app)
+    return app
+
 if __name__ == '__main__':
-    init_db(app.app_context())
-    app.run(debug=True, port=5001, host='0.0.0.0')
+    # Local runs only; serve production traffic with gunicorn (see wsgi.py / gunicorn.conf.py)
+    app = create_app()
+    app.run(port=5001, host='0.0.0.0', threaded=True)
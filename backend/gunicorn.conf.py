@@ -0,0 +1,14 @@
+# Gunicorn settings for the PSI backend (run from the backend/ directory: gunicorn -c gunicorn.conf.py wsgi:app)
+import multiprocessing
+import os
+
+bind = os.environ.get("PSI_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("PSI_WORKERS", min(4, multiprocessing.cpu_count())))
+# Chat requests spend seconds waiting on Ollama; gevent lets each worker hold many of them open at once
+worker_class = "gevent"
+worker_connections = int(os.environ.get("PSI_WORKER_CONNECTIONS", 128))
+# Streamed chat replies (SSE) can outlive the default 30 s worker timeout
+timeout = int(os.environ.get("PSI_WORKER_TIMEOUT", 300))
+# Not preloaded: the gevent worker has to patch the stdlib before app.py (threads, sockets) is imported
+preload_app = False
+accesslog = "-"
@@ -1,8 +1,17 @@
 import os
+import shutil
+import stat
 import time
 import json # Added for schema definition
 
 AGENT_WORKSPACE_DIR = os.path.expanduser('~/psi_pwa_linux_new/agent_workspace')
+# Created and resolved once at import; every tool call checks containment against this
+os.makedirs(AGENT_WORKSPACE_DIR, exist_ok=True)
+_WORKSPACE_ABS = os.path.realpath(AGENT_WORKSPACE_DIR)
+# Directories write_file_tool has already created, so repeat writes skip the makedirs syscalls
+_known_dirs: set = {_WORKSPACE_ABS}
+# read_file_tool never loads more than this many characters, however large the file is
+MAX_READ_CHARS = 10 * 1024 * 1024
 
 def _resolve_filepath(filename: str):
     """Safely resolves a filename to be within the agent workspace."""
@@ -16,28 +25,36 @@ def _resolve_filepath(filename: str):
     if '..' in safe_filename.split(os.path.sep):
         return None, f"Invalid filename: path traversal detected in '{filename}'."
 
-    filepath = os.path.join(AGENT_WORKSPACE_DIR, safe_filename)
+    filepath = os.path.realpath(os.path.join(_WORKSPACE_ABS, safe_filename))
 
-    # Final check to ensure the path is within the workspace
-    if not os.path.abspath(filepath).startswith(os.path.abspath(AGENT_WORKSPACE_DIR)):
+    # Final check to ensure the path is within the workspace. Symlinks are resolved above, and
+    # commonpath rejects sibling directories that merely share the prefix ("agent_workspace2")
+    if os.path.commonpath([filepath, _WORKSPACE_ABS]) != _WORKSPACE_ABS:
         return None, f"Attempted to access file outside workspace: {filename}"
     return filepath, None
 
-def read_file_tool(filename: str):
-    """Reads content from a file within the agent workspace."""
+def read_file_tool(filename: str, max_chars: int = MAX_READ_CHARS):
+    """Reads up to max_chars characters from a file within the agent workspace.
+
+    "size" is the file size in bytes; "truncated" is True when the file holds more than was read.
+    """
     filepath, error = _resolve_filepath(filename)
     if error:
         return {"tool_name": "read_file", "success": False, "error": error, "filename": filename}
 
     try:
-        if not os.path.exists(filepath):
+        try:
+            st = os.stat(filepath) # One stat answers both checks below and gives the size
+        except FileNotFoundError:
             return {"tool_name": "read_file", "success": False, "error": f"File not found: {filename}", "filename": filename}
-        if not os.path.isfile(filepath): # Ensure it's a file, not a directory
+        if not stat.S_ISREG(st.st_mode): # Ensure it's a file, not a directory
             return {"tool_name": "read_file", "success": False, "error": f"Path is not a file: {filename}", "filename": filename}
 
         with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return {"tool_name": "read_file", "success": True, "filename": filename, "content": content}
+            content = f.read(max_chars)
+            truncated = f.read(1) != ''
+        return {"tool_name": "read_file", "success": True, "filename": filename, "content": content,
+                "size": st.st_size, "truncated": truncated}
     except Exception as e:
         return {"tool_name": "read_file", "success": False, "filename": filename, "error": str(e)}
 
@@ -65,8 +82,16 @@ def write_file_tool(filename: str, content: str):
 
     try:
         # Create parent directories if they don't exist
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
+        dirpath = os.path.dirname(filepath)
+        if dirpath not in _known_dirs:
+            os.makedirs(dirpath, exist_ok=True)
+            _known_dirs.add(dirpath)
+        try:
+            f = open(filepath, 'w', encoding='utf-8')
+        except FileNotFoundError: # The directory was removed after it was cached
+            os.makedirs(dirpath, exist_ok=True)
+            f = open(filepath, 'w', encoding='utf-8')
+        with f:
             f.write(content)
         return {"tool_name": "write_file", "success": True, "filename": filename, "message": f"Content written to {filename}"}
     except Exception as e:
@@ -92,6 +117,56 @@ write_file_tool.tool_schema = {
     }
 }
 
+def write_file_from_path_tool(filename: str, source_filename: str):
+    """Writes a copy of another workspace file to filename, without passing its bytes through Python."""
+    source_path, error = _resolve_filepath(source_filename)
+    if error:
+        return {"tool_name": "write_file_from_path", "success": False, "error": error, "filename": filename}
+    filepath, error = _resolve_filepath(filename)
+    if error:
+        return {"tool_name": "write_file_from_path", "success": False, "error": error, "filename": filename}
+
+    try:
+        try:
+            st = os.stat(source_path)
+        except FileNotFoundError:
+            return {"tool_name": "write_file_from_path", "success": False, "error": f"File not found: {source_filename}", "filename": filename}
+        if not stat.S_ISREG(st.st_mode):
+            return {"tool_name": "write_file_from_path", "success": False, "error": f"Path is not a file: {source_filename}", "filename": filename}
+
+        dirpath = os.path.dirname(filepath)
+        if dirpath not in _known_dirs:
+            os.makedirs(dirpath, exist_ok=True)
+            _known_dirs.add(dirpath)
+        # On Linux copyfile moves the data in the kernel (sendfile), with no userspace buffer
+        shutil.copyfile(source_path, filepath)
+        return {"tool_name": "write_file_from_path", "success": True, "filename": filename,
+                "message": f"Copied {source_filename} to {filename} ({st.st_size} bytes)"}
+    except shutil.SameFileError:
+        return {"tool_name": "write_file_from_path", "success": False, "filename": filename, "error": "Source and destination are the same file."}
+    except Exception as e:
+        return {"tool_name": "write_file_from_path", "success": False, "filename": filename, "error": str(e)}
+
+# Schema for write_file_from_path_tool
+write_file_from_path_tool.tool_schema = {
+    "name": "write_file_from_path_tool", # Function name matches
+    "description": "Copies an existing file in the agent's workspace to another file. Use instead of reading and rewriting a file when its content should be duplicated unchanged.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "filename": {
+                "type": "string",
+                "description": "The name of the file to write to (e.g., 'backup/notes.txt'). Must be relative to the agent_workspace."
+            },
+            "source_filename": {
+                "type": "string",
+                "description": "The name of the existing file to copy from. Must be relative to the agent_workspace."
+            }
+        },
+        "required": ["filename", "source_filename"]
+    }
+}
+
 # For testing purposes if run directly
 if __name__ == '__main__':
     # Create workspace if it doesn't exist
@@ -113,14 +188,19 @@ if __name__ == '__main__':
         read_non_existent_result = read_file_tool("non_existent_file.txt")
         print(f"Read Non-Existent Result: {read_non_existent_result}")
 
+        # Test write_file_from_path_tool
+        copy_result = write_file_from_path_tool("test_file_copy.txt", "test_file.txt")
+        print(f"Copy Result: {copy_result}")
+
     # Test path traversal prevention in _resolve_filepath
     print(_resolve_filepath("../../../etc/passwd"))
     print(_resolve_filepath("/etc/passwd"))
     print(_resolve_filepath("valid_subfolder/file.txt"))
 
     # Clean up test file
-    if os.path.exists(os.path.join(AGENT_WORKSPACE_DIR, "test_file.txt")):
-        os.remove(os.path.join(AGENT_WORKSPACE_DIR, "test_file.txt"))
+    for test_filename in ("test_file.txt", "test_file_copy.txt"):
+        if os.path.exists(os.path.join(AGENT_WORKSPACE_DIR, test_filename)):
+            os.remove(os.path.join(AGENT_WORKSPACE_DIR, test_filename))
 
     # print("Schemas:")
     # print("read_file_tool schema:", json.dumps(read_file_tool.tool_schema, indent=2))
@@ -0,0 +1,7 @@
+# WSGI entry point for production serving:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# The gevent worker monkey-patches sockets before this module is imported, so the blocking
+# Ollama HTTP calls (httpx under the hood) yield to other requests instead of holding a thread.
+from app import create_app
+
+app = create_app()
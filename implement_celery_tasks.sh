@@ -17,7 +17,7 @@ cd backend || { echo "Failed to navigate to backend directory"; exit 1; }
 source ../venv/bin/activate || { echo "Failed to activate virtual environment"; exit 1; }
 
 # Install Celery and Redis Python packages
-pip install celery redis
+pip install celery redis orjson
 
 # Create backend/celeryconfig.py
 cat <<EOF > celeryconfig.py
@@ -28,11 +28,13 @@ EOF
 # Overwrite backend/app.py
 # Ensure this heredoc accurately reflects the intended changes to app.py
 cat <<EOF > app.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import select
 import os
 import time
+import orjson
 from celery import Celery
 
 app = Flask(__name__)
@@ -70,6 +72,9 @@ class Task(db.Model):
             'details': self.details
         }
 
+# The task list is polled while tasks run: read plain column tuples (no Task instances) and encode with orjson
+_TASK_LIST_STMT = select(Task.id, Task.name, Task.status, Task.progress, Task.details)
+
 @celery_app.task
 def simulate_long_running_process(task_id, duration):
     with app.app_context(): # Added app_context for DB operations
@@ -109,8 +114,12 @@ def create_task():
 
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    tasks = Task.query.all()
-    return jsonify([task.to_dict() for task in tasks])
+    rows = db.session.execute(_TASK_LIST_STMT).all()
+    tasks = [
+        {'id': task_id, 'name': name, 'status': status, 'progress': progress, 'details': details}
+        for task_id, name, status, progress, details in rows
+    ]
+    return Response(orjson.dumps(tasks), mimetype='application/json')
 
 @app.route('/api/tasks/<int:task_id>', methods=['GET'])
 def get_task(task_id):
@@ -191,6 +191,15 @@ echo ""
 
 # --- Step 3: Verify Ollama Service Status ---
 echo "--- Step 3: Verify Ollama Service Status ---"
+# Let the server handle concurrent chat requests in parallel instead of queueing them.
+OLLAMA_NUM_PARALLEL="${OLLAMA_NUM_PARALLEL:-4}"
+# Keep loaded model weights resident between requests instead of unloading them after 5 minutes.
+OLLAMA_KEEP_ALIVE="${OLLAMA_KEEP_ALIVE:-30m}"
+echo "Configuring Ollama service with OLLAMA_NUM_PARALLEL=$OLLAMA_NUM_PARALLEL, OLLAMA_KEEP_ALIVE=$OLLAMA_KEEP_ALIVE..."
+sudo mkdir -p /etc/systemd/system/ollama.service.d
+printf '[Service]\nEnvironment="OLLAMA_NUM_PARALLEL=%s"\nEnvironment="OLLAMA_KEEP_ALIVE=%s"\n' "$OLLAMA_NUM_PARALLEL" "$OLLAMA_KEEP_ALIVE" | sudo tee /etc/systemd/system/ollama.service.d/override.conf >/dev/null
+sudo systemctl daemon-reload
+sudo systemctl restart ollama || true
 echo "Checking if Ollama service is running..."
 # Attempt to start the service if it's not active.
 # The 'ollama' installer should set up the systemd service.
@@ -224,6 +233,17 @@ else
     echo "Proceeding with '$MODEL_NAME' model download..."
 fi
 
+# The orchestrator's base model (Step 5) downloads at the same time; both pulls are network-bound.
+# Its progress goes to a log file so the two progress bars don't interleave.
+ORCHESTRATOR_BASE_MODEL="${ORCHESTRATOR_BASE_MODEL:-mistral:7b-instruct-q4_K_M}"
+ORCHESTRATOR_PULL_PID=""
+if [ "$ORCHESTRATOR_BASE_MODEL" != "$MODEL_NAME" ]; then
+    ORCHESTRATOR_PULL_LOG="$PROJECT_DIR/ollama_pull_orchestrator.log"
+    echo "Downloading the orchestrator base model '$ORCHESTRATOR_BASE_MODEL' in the background (progress: $ORCHESTRATOR_PULL_LOG)."
+    ollama pull "$ORCHESTRATOR_BASE_MODEL" > "$ORCHESTRATOR_PULL_LOG" 2>&1 &
+    ORCHESTRATOR_PULL_PID=$!
+fi
+
 ollama pull "$MODEL_NAME"
 if [ $? -ne 0 ]; then
     echo ""
@@ -235,6 +255,34 @@ else
 fi
 echo ""
 
+# --- Step 5: Create Quantized Orchestrator Model ---
+# Routing decisions are a small classification task; a 4-bit build halves memory traffic
+# and roughly doubles tokens/sec. Use it with PSI_ORCHESTRATOR_MODEL=$ORCHESTRATOR_MODEL_NAME.
+# num_ctx matches ORCHESTRATOR_OPTIONS in app_chat_route.py, so requests don't trigger a model reload.
+echo "--- Step 5: Create Quantized Orchestrator Model ---"
+ORCHESTRATOR_MODEL_NAME="psi-orchestrator"
+printf 'FROM %s\nPARAMETER num_ctx 4096\nPARAMETER num_predict 256\n' "$ORCHESTRATOR_BASE_MODEL" > "$PROJECT_DIR/Modelfile.orchestrator"
+if [ -n "$ORCHESTRATOR_PULL_PID" ]; then
+    echo "Waiting for the '$ORCHESTRATOR_BASE_MODEL' download started in Step 4..."
+    wait "$ORCHESTRATOR_PULL_PID"
+    ORCHESTRATOR_PULL_STATUS=$?
+    if [ $ORCHESTRATOR_PULL_STATUS -ne 0 ]; then
+        tail -n 5 "$ORCHESTRATOR_PULL_LOG" >&2
+    fi
+else
+    # Same model as Step 4; pulling again is a quick no-op if that download succeeded
+    ollama pull "$ORCHESTRATOR_BASE_MODEL"
+    ORCHESTRATOR_PULL_STATUS=$?
+fi
+if [ $ORCHESTRATOR_PULL_STATUS -eq 0 ] && ollama create "$ORCHESTRATOR_MODEL_NAME" -f "$PROJECT_DIR/Modelfile.orchestrator"; then
+    echo "Orchestrator model '$ORCHESTRATOR_MODEL_NAME' created from '$ORCHESTRATOR_BASE_MODEL'."
+    echo "Start the backend with PSI_ORCHESTRATOR_MODEL=$ORCHESTRATOR_MODEL_NAME to use it."
+else
+    echo "WARNING: Failed to create the '$ORCHESTRATOR_MODEL_NAME' model. The orchestrator will use '$MODEL_NAME'." >&2
+    # Non-critical, like the model pull above.
+fi
+echo ""
+
 # --- Final Summary ---
 echo "========================================================="
 echo "        PSI PWA Linux Ollama & Core AI Setup Complete!"